@@ -31,6 +31,14 @@ admin.site.register(models.User, UserAdmin)
 
 # user login state portal
 class LoginStateAdmin(admin.ModelAdmin):
-    list_display = ('user', 'token')
+    list_display = ('user', 'token', 'device', 'os', 'browser', 'active_until')
 
 admin.site.register(models.LoginState, LoginStateAdmin)
+
+
+# email outbox portal
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_on', 'created_on', 'sent_on')
+    list_filter = ('status',)
+
+admin.site.register(models.EmailOutbox, EmailOutboxAdmin)
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class AccountConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'account'
+
+    def ready(self):
+        from django.conf import settings
+        from .sweeper import periodic_sweep
+
+        # connecting profile cache invalidation
+        from . import signals
+
+        # starting in-process expired login state sweeper
+        if settings.LOGIN_STATE_SWEEP_SECONDS:
+            periodic_sweep.task.start()
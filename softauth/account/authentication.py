@@ -1,12 +1,29 @@
-import user_agents
 from rest_framework import authentication
 from rest_framework import exceptions
-from .models import User
+from django.utils.functional import SimpleLazyObject
+from .models import User, LoginState
 from .services import LoginStateTokenService
+from .caches import principal_cache
+from .revocation import revocation_list
 from .jwt_token import Jwt
+from utils import useragent
 from urllib.parse import parse_qs
 
 
+# User resolved from access token claims, fetched from database only when a view needs more than uid
+class TokenUser(SimpleLazyObject):
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, uid):
+        super().__init__(lambda: User.objects.get(uid=uid))
+        self.__dict__['uid'] = uid
+        self.__dict__['pk'] = uid
+
+    def __bool__(self):
+        return True
+
+
 # User Authentication
 class UserAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
@@ -14,33 +31,43 @@ class UserAuthentication(authentication.BaseAuthentication):
             # getting validation success and payload from authentication token
             success, payload = Jwt.validate(request.META.get('HTTP_AUTHORIZATION'))
             payload_data = payload['data']
-        
+
             # validating authentication token
-            if not success or payload['type'] != 'LI' or payload_data['uid'] != request.META.get("HTTP_UID"):
+            if not success or payload['type'] not in ('LI', 'LA') or payload_data['uid'] != request.META.get("HTTP_UID"):
                 return None
 
-            try:
-                # fetching user from database
-                user = User.objects.get(uid=payload_data['uid'])
-            except User.DoesNotExist:
-                raise exceptions.AuthenticationFailed('No such Account found.')
-
-            try:
-                login_state = LoginStateTokenService.get(user=user)
+            user_agent_header = request.META['HTTP_USER_AGENT']
 
-                if login_state['login_token'] != request.META['HTTP_LST']:
+            # access token is authenticated from its signature and claims alone
+            if payload['type'] == 'LA':
+                if payload_data['fp'] != useragent.fingerprint(user_agent_header)[:16] or revocation_list.is_revoked(payload_data['sid']):
                     return None
+                return (TokenUser(payload_data['uid']), None)
 
-                # passing user agent data
-                ua = user_agents.parse(request.META['HTTP_USER_AGENT'])
+            login_token = request.META['HTTP_LST']
 
-                # validing login state token data with user agent
-                if login_state['browser'] != ua.browser.family or login_state['device'] != ua.device.family or login_state['os'] != ua.os.family:
-                    return None
-            except:
+            # returning already authenticated user
+            user = principal_cache.get(payload_data['uid'], login_token, user_agent_header)
+            if user is not None:
+                return (user, None)
+
+            try:
+                # fetching login state along with its user from database
+                login_state = LoginStateTokenService.get_with_user(token=login_token)
+                user = login_state.user
+            except LoginState.DoesNotExist:
                 raise exceptions.AuthenticationFailed('No Login user found.')
 
+            if user.uid != payload_data['uid'] or not login_state.is_active:
+                return None
+
+            # validing login state device fingerprint with user agent
+            if login_state.fingerprint != useragent.fingerprint(user_agent_header):
+                return None
+
+            # caching authenticated user for subsequent requests
+            principal_cache.set(user.uid, login_token, user_agent_header, user, login_state)
+
             return (user, None)
         except:
             return None
-
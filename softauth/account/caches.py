@@ -0,0 +1,119 @@
+import copy
+import threading
+from django.conf import settings
+from django.utils import timezone
+from utils.lru import LRUCache
+from utils.flowstate import FlowStateCodec
+from utils.cache import TieredCache
+
+
+class PrincipalCache:
+    '''In-process cache of authenticated user and login state keyed by uid, login state token and user agent.
+    Invalidation only reaches this process, other workers drop an entry within timeout.'''
+
+    def __init__(self, maxsize, timeout):
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.__cache = LRUCache(maxsize=maxsize, timeout=timeout)
+        self.__lock = threading.Lock()
+
+    # returns copy of cached user if the login state is still active
+    def get(self, uid, login_token, user_agent_header):
+        sessions = self.__cache.get(uid) or {}
+        principal = sessions.get((login_token, user_agent_header))
+
+        if principal is None or not principal[1].is_active:
+            with self.__lock:
+                self.misses += 1
+            return None
+
+        with self.__lock:
+            self.hits += 1
+        # copying the user so that request level changes never leaks into the cache
+        return copy.copy(principal[0])
+
+    # caches user and login state until login state active_until or cache timeout whichever comes first
+    def set(self, uid, login_token, user_agent_header, user, login_state):
+        timeout = (login_state.active_until - timezone.now()).total_seconds()
+        if self.timeout is not None:
+            timeout = min(timeout, self.timeout)
+
+        sessions = dict(self.__cache.get(uid) or {})
+        sessions[(login_token, user_agent_header)] = (copy.copy(user), login_state)
+        self.__cache.set(uid, sessions, timeout=timeout)
+
+    # removes all the cached login states of user
+    def invalidate(self, uid):
+        self.__cache.delete(uid)
+
+    # returns cache counters
+    def stats(self):
+        with self.__lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'size': len(self.__cache),
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+        }
+
+
+class EncKeyCache:
+    '''In-process only cache of decrypted user encryption keys, never written to a shared store'''
+
+    def __init__(self, maxsize, timeout):
+        self.__cache = LRUCache(maxsize=maxsize, timeout=timeout)
+
+    # returns decrypted key of uid if it was decrypted from the same stored cipher
+    def get(self, uid, cipher):
+        entry = self.__cache.get(uid)
+        if entry is None or entry[0] != cipher:
+            return None
+        return entry[1]
+
+    def set(self, uid, cipher, enc_key):
+        self.__cache.set(uid, (cipher, enc_key))
+
+    # removes decrypted key of uid, called when its cipher is rotated
+    def invalidate(self, uid):
+        self.__cache.delete(uid)
+
+    # removes every decrypted key, called when the server key is rotated
+    def clear(self):
+        self.__cache.clear()
+
+    # returns cache counters
+    def stats(self):
+        return self.__cache.stats()
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    timeout=settings.PRINCIPAL_CACHE_TIMEOUT,
+)
+
+enc_key_cache = EncKeyCache(
+    maxsize=settings.ENC_KEY_CACHE_SIZE,
+    timeout=settings.ENC_KEY_CACHE_TIMEOUT,
+)
+
+# signup and password recovery flow states, stored in the cache as compact bytes
+signup_state = FlowStateCodec(
+    fields=('first_name', 'last_name', 'gender', 'date_of_birth', 'email', 'password', 'msg_token', 'otp'),
+    compress=settings.FLOW_STATE_COMPRESSION,
+)
+
+recovery_state = FlowStateCodec(
+    fields=('email', 'otp'),
+    compress=settings.FLOW_STATE_COMPRESSION,
+)
+
+# user profile responses by uid
+profile_cache = TieredCache(
+    namespace='profile',
+    l1_size=settings.PROFILE_CACHE_SIZE,
+    l1_timeout=settings.PROFILE_CACHE_L1_TIMEOUT,
+    timeout=settings.PROFILE_CACHE_TIMEOUT,
+)
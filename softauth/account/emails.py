@@ -0,0 +1,128 @@
+import hashlib
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from utils.bloom import BloomFilter
+from utils.periodic import PeriodicTask
+from .models import User
+
+
+class RegisteredEmails:
+    '''In-process Bloom filter of registered emails, a negative means no user has the email so the database is skipped.
+    Built on a background thread on first use, refreshed incrementally from users created since the newest one read
+    and rebuilt every rebuild_interval. Emails registered through add are also marked in the shared cache until a
+    rebuild of every worker has read them, so a negative of a filter not refreshed since is checked against the mark.'''
+
+    OVERLAP_SECONDS = 30
+
+    def __init__(self, capacity, error_rate, refresh_interval, rebuild_interval, chunk_size=5000):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.chunk_size = chunk_size
+        self.mark_timeout = rebuild_interval + 2 * refresh_interval + self.OVERLAP_SECONDS
+        self.__bloom = None
+        self.__bloom_capacity = 0
+        self.__built_on = None
+        self.__refreshed_on = None
+        self.__cursor = None
+        self.__started = False
+        self.__lock = threading.Lock()
+        self.__refresh_lock = threading.Lock()
+        self.__task = PeriodicTask(refresh_interval, self.refresh, name='registered-emails-refresh')
+
+    # emails are compared case insensitively, so the filter holds for any database collation
+    @staticmethod
+    def normalize(email):
+        return str(email).strip().lower()
+
+    @staticmethod
+    def __mark_key(email):
+        return f'registered-email:{hashlib.blake2b(email.encode("utf-8"), digest_size=16).hexdigest()}'
+
+    # returns False only if no user is registered with email, always True until the filter is built
+    def might_exist(self, email):
+        bloom = self.__bloom
+        if bloom is None:
+            self.start()
+            return True
+
+        email = self.normalize(email)
+        if email in bloom:
+            return True
+
+        # users registered on other workers since this filter was refreshed are only marked in the shared cache
+        return cache.get(self.__mark_key(email)) is not None
+
+    # adds email of a user created by this worker and marks it for other workers until they have read it
+    def add(self, email):
+        email = self.normalize(email)
+        cache.set(self.__mark_key(email), 1, timeout=self.mark_timeout)
+
+        if self.__bloom is not None:
+            self.__bloom.add(email)
+
+    # builds the filter on a background thread once and starts the periodic refresh
+    def start(self):
+        with self.__lock:
+            if self.__started:
+                return
+            self.__started = True
+
+        threading.Thread(target=self.__build, name='registered-emails-build', daemon=True).start()
+
+    def __build(self):
+        try:
+            self.refresh()
+        finally:
+            close_old_connections()
+        self.__task.start()
+
+    # streams every email into a new filter when none exists, it outgrew its capacity or rebuild_interval passed,
+    # otherwise adds emails of users created since the newest one read before
+    def refresh(self):
+        with self.__refresh_lock:
+            now = timezone.now()
+
+            # a full rebuild recovers emails an incremental refresh missed, as rows committed later than the overlap
+            if self.__bloom is None or len(self.__bloom) >= self.__bloom_capacity or now - self.__built_on >= timedelta(seconds=self.rebuild_interval):
+                self.__bloom_capacity = max(self.capacity, 2 * User.objects.count())
+                bloom = BloomFilter(self.__bloom_capacity, self.error_rate)
+                users = User.objects.all()
+                cursor = None
+                self.__built_on = now
+            else:
+                # the cursor is the newest created_at read, overlapped so rows committed late are not skipped
+                bloom = self.__bloom
+                cursor = self.__cursor
+                users = User.objects.filter(created_at__gte=cursor - timedelta(seconds=self.OVERLAP_SECONDS)) if cursor is not None else User.objects.all()
+
+            for email, created_at in users.values_list('email', 'created_at').iterator(chunk_size=self.chunk_size):
+                bloom.add(self.normalize(email))
+                if cursor is None or created_at > cursor:
+                    cursor = created_at
+
+            self.__cursor = cursor
+            self.__refreshed_on = now
+            self.__bloom = bloom
+
+    def stats(self):
+        return {
+            'entries': len(self.__bloom) if self.__bloom is not None else 0,
+            'capacity': self.__bloom_capacity,
+            'built_on': self.__built_on,
+            'refreshed_on': self.__refreshed_on,
+            'cursor': self.__cursor,
+            'refreshing': self.__task.is_running,
+        }
+
+
+registered_emails = RegisteredEmails(
+    capacity=settings.EMAIL_FILTER_CAPACITY,
+    error_rate=settings.EMAIL_FILTER_ERROR_RATE,
+    refresh_interval=settings.EMAIL_FILTER_REFRESH_SECONDS,
+    rebuild_interval=settings.EMAIL_FILTER_REBUILD_SECONDS,
+)
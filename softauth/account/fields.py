@@ -0,0 +1,53 @@
+import uuid
+from django import forms
+from django.core import exceptions
+from django.db import models
+from utils import uid as uid_codec
+
+
+class PublicUIDField(models.UUIDField):
+    '''UUID column, natively 16 bytes where the database supports it, whose Python value is the public uid string'''
+
+    description = 'Public uid stored as UUID'
+
+    def to_python(self, value):
+        if value is None:
+            return value
+
+        try:
+            if isinstance(value, uuid.UUID):
+                return uid_codec.encode(value)
+
+            # validating public uid
+            uid_codec.decode(value)
+            return value
+        except (AttributeError, TypeError, ValueError):
+            raise exceptions.ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(value)
+        return uid_codec.encode(value)
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+
+        try:
+            return uid_codec.decode(value)
+        except (AttributeError, TypeError, ValueError):
+            raise exceptions.ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+
+        if value is None or connection.features.has_native_uuid_field:
+            return value
+        return value.hex
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{'form_class': forms.CharField, 'max_length': 36, **kwargs})
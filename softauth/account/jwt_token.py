@@ -1,23 +1,123 @@
 import base64
+import copy
+import json
+import hashlib
+import time
+import calendar
+import jwt
+from jwt.algorithms import HMACAlgorithm
+from datetime import datetime, timedelta
 from django.utils import timezone
-from datetime import timedelta
 from django.conf import settings
-from jwt import encode, decode
-from utils.security import AES256
+from utils.security import AEAD, server_cipher
+from utils.lru import LRUCache
+
+
+# returns base64url encoded bytes without padding
+def base64url_encode(raw: bytes):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=')
+
+# returns base64url decoded bytes of unpadded segment
+def base64url_decode(segment: bytes):
+    return base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+
+
+class JwtVerifier:
+    '''PyJWT HS256 signer and verifier holding its prepared HMAC key, with an optional LRU of recently verified tokens'''
+
+    ALGORITHM = 'HS256'
+
+    def __init__(self, secret, cache_size=0):
+        self.__jwt = jwt.PyJWT()
+        self.__algorithm = HMACAlgorithm(HMACAlgorithm.SHA256)
+        self.__key = self.__algorithm.prepare_key(secret)
+        self.__cache = LRUCache(maxsize=cache_size) if cache_size > 0 else None
+
+        # header segment of the tokens encode issues, only other headers go through the full PyJWT decode
+        self.__header = self.encode({}).encode('ascii').split(b'.', 1)[0]
+
+    # returns compact json of payload, datetime claims are converted to epoch seconds
+    @staticmethod
+    def serialize(payload: dict):
+        claims = dict(payload)
+        for claim in ('exp', 'iat', 'nbf'):
+            if isinstance(claims.get(claim), datetime):
+                claims[claim] = calendar.timegm(claims[claim].utctimetuple())
+
+        return json.dumps(claims, separators=(',', ':')).encode('utf-8')
+
+    # returns signed token of payload
+    def encode(self, payload: dict):
+        return self.__jwt.encode(payload, self.__key, algorithm=self.ALGORITHM)
+
+    # returns decoded payload of token, raises ValueError if token is malformed, forged or expired
+    def decode(self, token):
+        if isinstance(token, str):
+            token = token.encode('ascii')
+
+        digest = None
+
+        if self.__cache is not None:
+            digest = hashlib.blake2b(token, digest_size=16).digest()
+            payload = self.__cache.get(digest)
+            if payload is not None:
+                self.check_time_claims(payload, int(time.time()))
+                # copying so a caller changing its payload never alters the cached one
+                return copy.deepcopy(payload)
+
+        segments = token.split(b'.')
+        if len(segments) == 3 and segments[0] == self.__header:
+            payload = self.__verify(token, segments[1], segments[2])
+        else:
+            try:
+                payload = self.__jwt.decode(token, self.__key, algorithms=[self.ALGORITHM])
+            except jwt.InvalidTokenError as e:
+                raise ValueError(str(e))
+
+        if digest is not None:
+            timeout = payload['exp'] - int(time.time()) if 'exp' in payload else None
+            self.__cache.set(digest, copy.deepcopy(payload), timeout=timeout)
+
+        return payload
+
+    # returns verified payload of token having the known header, skipping the header parsing and option handling of PyJWT
+    def __verify(self, token, payload_segment, signature):
+        if not self.__algorithm.verify(token[:token.rindex(b'.')], self.__key, base64url_decode(signature)):
+            raise ValueError('Signature verification failed')
+
+        payload = json.loads(base64url_decode(payload_segment))
+        if not isinstance(payload, dict):
+            raise ValueError('Invalid payload string: must be a json object')
+
+        self.check_time_claims(payload, int(time.time()))
+        return payload
+
+    # raises ValueError if payload is expired or not yet valid at epoch seconds now
+    @staticmethod
+    def check_time_claims(payload, now):
+        if 'exp' in payload and int(payload['exp']) <= now:
+            raise ValueError('Token expired.')
+
+        if 'nbf' in payload and int(payload['nbf']) > now:
+            raise ValueError('Token not yet valid.')
+
+    def stats(self):
+        return self.__cache.stats() if self.__cache is not None else {}
+
+
+verifier = JwtVerifier(settings.JWT_SECRET, cache_size=settings.JWT_VERIFIED_CACHE_SIZE)
 
 
 class Jwt:
     # returns the payload if JWT token is valid
     @staticmethod
     def validate(token):
-        payload = {}
         try:
-            payload = decode(token, settings.JWT_SECRET, algorithms=["HS256"])
-            return (True, payload)
-        except:
-            return (False, payload)
-    
-    # returns generated JWT token using the given payload type, data and seconds 
+            return (True, verifier.decode(token))
+        except (ValueError, TypeError, AttributeError):
+            return (False, {})
+
+    # returns generated JWT token using the given payload type, data and seconds
     @staticmethod
     def generate(type, data, seconds = None):
         payload = { 'type': type, 'data': data }
@@ -25,27 +125,46 @@ class Jwt:
         if seconds != None:
             payload['exp'] = timezone.now() + timedelta(seconds=seconds)
 
-        token = encode(payload, settings.JWT_SECRET, algorithm = 'HS256')
+        token = verifier.encode(payload)
         return token
 
 
 class EncryptedJwt:
+    '''Token claims sealed with an AEAD as "e1." + base64url(AEAD blob), legacy AES-Everywhere tokens are still accepted'''
+
+    VERSION = 'e1.'
+    cipher = AEAD(settings.SERVER_ENC_KEY, context=b'softauth encrypted jwt v1')
+
     # returns the payload if Encrypted JWT token is valid
     @staticmethod
     def validate(token: str):
-        base64_token = base64.b64decode(token.encode('ascii'))
-        token = base64_token.decode('ascii')
-        aes = AES256(settings.SERVER_ENC_KEY)
-        token = aes.decrypt(token)
-        return Jwt.validate(token)
-    
-    # returns generated Encrypted JWT token using the given payload type, data and seconds 
+        try:
+            if not token.startswith(EncryptedJwt.VERSION):
+                return EncryptedJwt.__validate_legacy(token)
+
+            # authenticated decryption replaces the jwt signature check
+            blob = base64url_decode(token[len(EncryptedJwt.VERSION):].encode('ascii'))
+            payload = json.loads(EncryptedJwt.cipher.decrypt(blob))
+            JwtVerifier.check_time_claims(payload, int(time.time()))
+            return (True, payload)
+        except (ValueError, TypeError, AttributeError, KeyError):
+            return (False, {})
+
+    # returns generated Encrypted JWT token using the given payload type, data and seconds
     @staticmethod
     def generate(type, data, seconds = None):
-        token = Jwt.generate(type, data, seconds)
-        aes = AES256(settings.SERVER_ENC_KEY)
-        enc_token = aes.encrypt(token)
-        base64_token = base64.b64encode(enc_token.encode('ascii'))
+        payload = { 'type': type, 'data': data }
+
+        if seconds != None:
+            payload['exp'] = timezone.now() + timedelta(seconds=seconds)
+
+        blob = EncryptedJwt.cipher.encrypt(JwtVerifier.serialize(payload))
+        return EncryptedJwt.VERSION + base64url_encode(blob).decode('ascii')
+
+    # returns the payload of double base64 AES-Everywhere token issued before e1 tokens
+    @staticmethod
+    def __validate_legacy(token: str):
+        base64_token = base64.b64decode(token.encode('ascii'))
         token = base64_token.decode('ascii')
-        return token
-    
+        token = server_cipher().decrypt(token)
+        return Jwt.validate(token)
@@ -0,0 +1,42 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from utils.security import AES256, server_cipher
+from utils import generator
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the server keyring against the per call AES256 class on user encryption keys.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10000)
+        parser.add_argument('--bulk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        iterations, bulk_size = options['iterations'], options['bulk_size']
+        raws = [generator.generate_password_key() for _ in range(bulk_size)]
+
+        legacy = AES256(settings.SERVER_ENC_KEY)
+        keyring = server_cipher()
+        legacy_cipher, keyring_cipher = legacy.encrypt(raws[0]), keyring.encrypt(raws[0])
+        keyring_ciphers = keyring.encrypt_many(raws)
+
+        benchmarks = (
+            ('AES256 encrypt', iterations, lambda: AES256(settings.SERVER_ENC_KEY).encrypt(raws[0])),
+            ('AES256 decrypt', iterations, lambda: AES256(settings.SERVER_ENC_KEY).decrypt(legacy_cipher)),
+            ('keyring encrypt', iterations, lambda: keyring.encrypt(raws[0])),
+            ('keyring decrypt', iterations, lambda: keyring.decrypt(keyring_cipher)),
+            ('keyring decrypt legacy', iterations, lambda: keyring.decrypt(legacy_cipher)),
+            ('keyring encrypt_many', max(1, iterations // bulk_size), lambda: keyring.encrypt_many(raws)),
+            ('keyring decrypt_many', max(1, iterations // bulk_size), lambda: keyring.decrypt_many(keyring_ciphers)),
+        )
+
+        for label, rounds, function in benchmarks:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                function()
+            elapsed = time.perf_counter() - start
+
+            # bulk calls are reported per item
+            items = rounds * (bulk_size if label.endswith('_many') else 1)
+            self.stdout.write(f'{label:<24} {elapsed / items * 1e6:8.2f} us/item')
@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from account.models import User, LoginState
+from account.services import LoginStateTokenService
+from utils import generator
+
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks LoginStateTokenService.create for users having many stale sessions, all the writes are rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--stale-sessions', type=int, default=300)
+        parser.add_argument('--logins', type=int, default=5, help='logins per user after seeding stale sessions')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['users'], options['stale_sessions'], options['logins'])
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def run(self, users_count, stale_count, logins):
+        now = timezone.now()
+
+        # seeding users with stale sessions
+        users = User.objects.bulk_create([
+            User(uid=generator.generate_uuid(), email=f'bench_{i}_{generator.generate_milli_string()}@example.com', username=generator.generate_string('bench', 16))
+            for i in range(users_count)
+        ])
+        LoginState.objects.bulk_create([
+            LoginState(user=user, token=generator.generate_token(), created_on=now - timedelta(minutes=j), active_until=now)
+            for user in users for j in range(stale_count)
+        ], batch_size=1000)
+
+        # timing first login, which trims the stale sessions, apart from steady state logins
+        for label, rounds in (('first login', 1), ('steady logins', logins - 1)):
+            if rounds <= 0:
+                continue
+
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    for user in users:
+                        LoginStateTokenService.create(user, USER_AGENT, settings.AUTH_EXPIRE_SECONDS)
+                elapsed = time.perf_counter() - start
+
+            calls = rounds * len(users)
+            self.stdout.write(f'{label}: {calls} calls, {elapsed / calls * 1000:.3f} ms/call, {len(queries) / calls:.1f} queries/call')
+
+        remaining = LoginState.objects.filter(user__in=users).count()
+        self.stdout.write(f'sessions left: {remaining} for {len(users)} users (max {settings.MAX_LOGIN_SESSIONS} each)')
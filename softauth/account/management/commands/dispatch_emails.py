@@ -0,0 +1,64 @@
+import threading
+import time
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import connection as db_connection
+from account.outbox import email_dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Sends emails queued in the database outbox in claimed batches, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--workers', type=int, default=4, help='sender threads, each with its own SMTP connection')
+        parser.add_argument('--sleep', type=float, default=1.0, help='seconds to wait when no email is due')
+        parser.add_argument('--once', action='store_true', help='exit once no email is due')
+
+    def handle(self, *args, **options):
+        dispatcher = email_dispatcher(options['batch_size'])
+        self.lock = threading.Lock()
+        self.sent = self.failed = 0
+        self.start = time.perf_counter()
+
+        threads = [
+            threading.Thread(target=self.run, args=(dispatcher, options['sleep'], options['once']), name=f'email-dispatcher-{index}', daemon=True)
+            for index in range(max(options['workers'], 1))
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            pass
+
+        elapsed = time.perf_counter() - self.start
+        self.stdout.write(self.style.SUCCESS(f'sent {self.sent}, failed {self.failed} in {elapsed:.2f}s ({self.sent / max(elapsed, 1e-6):.0f} emails/sec)'))
+
+    def run(self, dispatcher, sleep, once):
+        connection = get_connection(fail_silently=False)
+
+        try:
+            while True:
+                emails = dispatcher.claim()
+                if not emails:
+                    if once:
+                        return
+                    # closing connection while idle so the SMTP server does not drop it mid batch
+                    connection.close()
+                    time.sleep(sleep)
+                    continue
+
+                sent, failed = dispatcher.send(emails, connection)
+
+                with self.lock:
+                    self.sent += sent
+                    self.failed += failed
+                    elapsed = time.perf_counter() - self.start
+                    self.stdout.write(f'sent {self.sent}, failed {self.failed}, {self.sent / max(elapsed, 1e-6):.0f} emails/sec')
+        finally:
+            connection.close()
+            db_connection.close()
@@ -0,0 +1,216 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+import django
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from django.contrib.auth import hashers
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, IntegrityError
+from account.models import User
+from utils import generator, security, validators
+from utils.usernames import UsernameAllocator
+
+
+ACC_TYPES = ('STUDENT', 'DEPARTMENT')
+GENDERS = ('M', 'F', 'O')
+
+
+# returns (encoded passwords, encrypted enc keys) of passwords, an empty password gets an unusable one
+# runs in worker processes, each worker keeps its own keyring
+def prepare(passwords):
+    keyring = security.server_cipher()
+    enc_keys = keyring.encrypt_many([generator.generate_password_key() for _ in passwords])
+    return [hashers.make_password(password or None) for password in passwords], enc_keys
+
+
+class Command(BaseCommand):
+    help = 'Imports STUDENT and DEPARTMENT users from a CSV or JSONL file, hashing passwords in worker processes and inserting in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='CSV or JSONL file, - reads standard input')
+        parser.add_argument('--format', type=str, choices=('csv', 'jsonl'), default=None, help='input format, guessed from the file extension by default')
+        parser.add_argument('--acc-type', type=str, choices=ACC_TYPES, default='STUDENT', help='account type of rows without one')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='hashing worker processes')
+        parser.add_argument('--verified', action='store_true', help='mark imported users as verified')
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'jsonl')
+        batch_size = max(options['batch_size'], 1)
+        workers = max(options['workers'] or 1, 1)
+        self.options = options
+        self.allocator = UsernameAllocator(User)
+        self.imported = self.skipped = self.invalid = 0
+
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig') if options['path'] == '-' else open(options['path'], encoding='utf-8-sig', newline='')
+        rows = self.__read(stream, input_format)
+
+        scanned = 0
+        start = time.perf_counter()
+        pending = deque()
+
+        # spawned workers never query and start without this process's connections, which stay open in its transaction
+        with stream, ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup) as pool:
+            while True:
+                # reading ahead while workers hash, bounded so memory stays flat on any file size
+                while len(pending) < 2 * workers:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+
+                    scanned += len(batch)
+                    users = self.__skip_existing(self.__clean(batch))
+                    future = pool.submit(prepare, [password for _, password in users]) if users else None
+                    pending.append(([user for user, _ in users], future))
+
+                if not pending:
+                    break
+
+                # inserting batches in input order, so a repeated email keeps its first row
+                users, future = pending.popleft()
+                if future is not None:
+                    passwords, enc_keys = future.result()
+                    for user, password, enc_key in zip(users, passwords, enc_keys):
+                        user.password = password
+                        user.enc_key = enc_key
+                    self.__insert(users)
+
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'scanned {scanned}, imported {self.imported}, skipped {self.skipped}, invalid {self.invalid}, '
+                    f'{self.imported / max(elapsed, 1e-6):.0f} users/sec'
+                )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'imported {self.imported} of {scanned} rows in {elapsed:.2f}s ({self.imported / max(elapsed, 1e-6):.0f} users/sec), '
+            f'{self.skipped} already registered, {self.invalid} invalid'
+        ))
+
+    # yields (line number, row dict) of stream
+    def __read(self, stream, input_format):
+        if input_format == 'csv':
+            reader = csv.DictReader(stream)
+            if reader.fieldnames is None or 'email' not in reader.fieldnames:
+                raise CommandError('CSV input must have a header row with an email column.')
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+    # returns (user, raw password) of valid rows of batch, reporting invalid ones
+    # rows are checked with the signup rules, a row without password gets an unusable one to be set through password recovery
+    def __clean(self, batch):
+        users, emails = [], set()
+
+        for line_number, row in batch:
+            try:
+                if row is None:
+                    raise ValidationError('Malformed row.')
+
+                first_name = str(row.get('first_name') or '').strip().lower()
+                last_name = str(row.get('last_name') or '').strip().lower()
+                gender = str(row.get('gender') or '').strip().upper()
+                date_of_birth = str(row.get('date_of_birth') or '').strip()
+                email = User.objects.normalize_email(str(row.get('email') or '').strip())
+                password = str(row.get('password') or '')
+                acc_type = str(row.get('acc_type') or self.options['acc_type']).strip().upper()
+
+                if validators.is_empty(first_name) or not validators.atleast_length(first_name, 3) or validators.contains_script(first_name):
+                    raise ValidationError('First name must contains atleast 3 characters.')
+
+                if validators.is_empty(last_name) or not validators.atleast_length(last_name, 2) or validators.contains_script(last_name):
+                    raise ValidationError('Last name must contains atleast 2 characters.')
+
+                if gender not in GENDERS:
+                    raise ValidationError('Gender must be M, F or O.')
+
+                if validators.is_empty(date_of_birth) or not validators.is_equal_length(date_of_birth, 10):
+                    raise ValidationError('Invalid Date of Birth.')
+
+                if not validators.is_email(email):
+                    raise ValidationError('Invalid Email')
+
+                if email in emails:
+                    raise ValidationError('Email repeated in batch.')
+
+                if acc_type not in ACC_TYPES:
+                    raise ValidationError(f'Account type must be one of {", ".join(ACC_TYPES)}.')
+
+                user = User(
+                    uid=generator.generate_uuid(),
+                    email=email,
+                    first_name=first_name,
+                    last_name=last_name,
+                    gender=gender,
+                    date_of_birth=date_of_birth,
+                    acc_type=acc_type,
+                    is_signed=True,
+                    is_active=True,
+                    is_verified=self.options['verified'],
+                )
+
+                if password:
+                    if not validators.atleast_length(password, 8) or not validators.atmost_length(password, 32) or not validators.is_password(password):
+                        raise ValidationError('Password must be of 8 to 32 character, contains atleast one number and one character.')
+                    validate_password(password, user)
+            except ValidationError as e:
+                self.invalid += 1
+                self.stderr.write(f'line {line_number}: {" ".join(e.messages)}')
+                continue
+
+            emails.add(email)
+            users.append((user, password))
+
+        return users
+
+    # returns items whose user email is not registered yet, so no hashing is spent on them
+    def __skip_existing(self, items):
+        existing = self.__existing([user.email for user, _ in items])
+        self.skipped += sum(1 for user, _ in items if user.email in existing)
+        return [(user, password) for user, password in items if user.email not in existing]
+
+    # returns the emails that are registered
+    @staticmethod
+    def __existing(emails):
+        return set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+
+    # inserts users in one transaction, allocating usernames right before so earlier batches are seen
+    def __insert(self, users):
+        for attempt in range(2):
+            # emails of batches hashed in parallel may have been registered since they were read
+            existing = self.__existing([user.email for user in users])
+            if existing:
+                self.skipped += sum(1 for user in users if user.email in existing)
+                users = [user for user in users if user.email not in existing]
+
+            usernames = self.allocator.allocate_many([generator.generate_username_base(user.first_name, user.last_name) for user in users])
+            for user, username in zip(users, usernames):
+                user.username = username
+
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create(users)
+                break
+            except IntegrityError:
+                # retrying once when a concurrent signup took an email or username of the batch
+                if attempt:
+                    raise
+
+        self.imported += len(users)
@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import time
+import django
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from account.models import User
+from utils import security
+
+
+# returns ciphers of enc keys re-encrypted with the current server key, None for ciphers that fail to decrypt
+# runs in worker processes, each worker keeps its own keyring
+def reencrypt(ciphers):
+    keyring = security.server_cipher()
+
+    try:
+        return keyring.encrypt_many(keyring.decrypt_many(ciphers))
+    except ValueError:
+        pass
+
+    # isolating the ciphers that fail so the rest of the chunk is still rotated
+    rotated = []
+    for cipher in ciphers:
+        try:
+            rotated.append(keyring.encrypt(keyring.decrypt(cipher)))
+        except ValueError:
+            rotated.append(None)
+    return rotated
+
+
+class Command(BaseCommand):
+    help = 'Re-encrypts user encryption keys with the current server key in primary key ordered chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='encryption worker processes')
+        parser.add_argument('--checkpoint', type=str, default=None, help='file to store the last rotated primary key in, resumes from it when present')
+        parser.add_argument('--start-pk', type=str, default=None, help='primary key to start after')
+
+    def handle(self, *args, **options):
+        keyring = security.server_cipher()
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        workers = max(options['workers'] or 1, 1)
+
+        # resuming after given primary key or the last checkpoint
+        cursor = options['start_pk']
+        if cursor is None and checkpoint is not None and checkpoint.exists():
+            cursor = checkpoint.read_text().strip() or None
+        if cursor is not None:
+            try:
+                cursor = User._meta.pk.to_python(cursor)
+            except ValidationError:
+                raise CommandError(f'Invalid start primary key {cursor!r}.')
+
+        scanned = rotated = failed = 0
+        start = time.perf_counter()
+        pending = deque()
+        exhausted = False
+
+        # spawned workers never query and start without this process's connections, which stay open in its transaction
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup) as pool:
+            while True:
+                # reading ahead while workers encrypt, bounded so memory stays flat on any table size
+                while not exhausted and len(pending) < 2 * workers:
+                    users = User.objects.filter(pk__gt=cursor) if cursor is not None else User.objects.all()
+                    rows = list(users.order_by('pk').values_list('pk', 'enc_key')[:options['chunk_size']])
+                    if not rows:
+                        exhausted = True
+                        break
+
+                    cursor = rows[-1][0]
+                    stale = [(pk, cipher) for pk, cipher in rows if cipher and keyring.needs_rotation(cipher)]
+                    future = pool.submit(reencrypt, [cipher for _, cipher in stale]) if stale else None
+                    pending.append((cursor, len(rows), [pk for pk, _ in stale], future))
+
+                if not pending:
+                    break
+
+                # applying chunks in primary key order so the checkpoint never skips a chunk
+                chunk_cursor, chunk_scanned, pks, future = pending.popleft()
+                if future is not None:
+                    users = [User(uid=pk, enc_key=cipher) for pk, cipher in zip(pks, future.result()) if cipher is not None]
+                    with transaction.atomic():
+                        User.objects.bulk_update(users, ['enc_key'])
+
+                    rotated += len(users)
+                    failed += len(pks) - len(users)
+
+                scanned += chunk_scanned
+                if checkpoint is not None:
+                    checkpoint.write_text(chunk_cursor)
+
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f'scanned {scanned}, rotated {rotated}, failed {failed}, cursor {chunk_cursor}, {scanned / max(elapsed, 1e-6):.0f} users/sec')
+
+        # rotation finished, next run starts from the beginning
+        if checkpoint is not None and checkpoint.exists():
+            checkpoint.unlink()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'rotated {rotated} of {scanned} users to key {keyring.current_id} in {elapsed:.2f}s '
+            f'({scanned / max(elapsed, 1e-6):.0f} users/sec), {failed} failed'
+        ))
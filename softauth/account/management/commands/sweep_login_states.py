@@ -0,0 +1,47 @@
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from account.sweeper import login_state_sweeper, revoked_session_sweeper
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired login states and outdated revocations in bounded primary key batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--sleep', type=float, default=0.0, help='seconds to pause between batches')
+        parser.add_argument('--start-pk', type=int, default=None, help='primary key to start the login state sweep from')
+        parser.add_argument('--checkpoint', type=str, default=None, help='file to store the login state sweep cursor in, resumes from it when present')
+
+    def handle(self, *args, **options):
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+
+        # resuming from given primary key or the last checkpoint
+        start_pk = options['start_pk']
+        if start_pk is None and checkpoint is not None and checkpoint.exists():
+            start_pk = int(checkpoint.read_text().strip() or 0)
+
+        self.sweep('login states', login_state_sweeper(options['batch_size']), start_pk or 0, options['sleep'], checkpoint)
+        self.sweep('revoked sessions', revoked_session_sweeper(options['batch_size']), 0, options['sleep'], None)
+
+        # sweep finished, next run starts from the beginning
+        if checkpoint is not None and checkpoint.exists():
+            checkpoint.unlink()
+
+    def sweep(self, label, sweeper, start_pk, sleep, checkpoint):
+        total, start = 0, time.perf_counter()
+
+        for cursor, deleted in sweeper.sweep(start_pk=start_pk):
+            total += deleted
+            elapsed = time.perf_counter() - start
+
+            if checkpoint is not None and cursor is not None:
+                checkpoint.write_text(str(cursor))
+
+            self.stdout.write(f'{label}: deleted {deleted}, cursor {cursor}, {total / max(elapsed, 1e-6):.0f} rows/sec')
+
+            if sleep:
+                time.sleep(sleep)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'{label}: deleted {total} rows in {elapsed:.2f}s ({total / max(elapsed, 1e-6):.0f} rows/sec)'))
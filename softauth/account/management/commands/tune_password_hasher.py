@@ -0,0 +1,72 @@
+import os
+import time
+import argon2
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks Argon2 on this host and suggests costs that keep one password hash within a latency budget.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250.0, help='latency budget of one password hash')
+        parser.add_argument('--max-memory', type=int, default=64 * 1024, help='largest memory cost to try in KiB')
+        parser.add_argument('--min-memory', type=int, default=19 * 1024, help='smallest memory cost to accept in KiB')
+        parser.add_argument('--workers', type=int, default=settings.HASHING_MAX_WORKERS, help='hashes running at once on this host')
+        parser.add_argument('--samples', type=int, default=3)
+
+    def handle(self, *args, **options):
+        target = options['target_ms'] / 1000
+        cores = os.cpu_count() or 1
+
+        # sharing the cores between the hashes the hashing executor runs at once
+        parallelism = max(cores // max(options['workers'], 1), 1)
+
+        self.stdout.write(f'cores {cores}, hashing workers {options["workers"]}, parallelism {parallelism}, budget {options["target_ms"]:.0f}ms')
+
+        current = get_hasher('default')
+        start = time.perf_counter()
+        current.encode('password-tuning', current.salt())
+        self.stdout.write(f'current {current.algorithm} hasher: {(time.perf_counter() - start) * 1000:.1f}ms')
+
+        # lowering memory until one pass fits, then adding passes while they still fit
+        memory_cost = options['max_memory']
+        elapsed = self.measure(1, memory_cost, parallelism, options['samples'])
+        while elapsed > target and memory_cost // 2 >= options['min_memory']:
+            memory_cost //= 2
+            elapsed = self.measure(1, memory_cost, parallelism, options['samples'])
+
+        time_cost = 1
+        while True:
+            next_elapsed = self.measure(time_cost + 1, memory_cost, parallelism, options['samples'])
+            if next_elapsed > target:
+                break
+            time_cost, elapsed = time_cost + 1, next_elapsed
+
+        if elapsed > target:
+            self.stdout.write(self.style.WARNING(f'smallest costs take {elapsed * 1000:.1f}ms, over the budget'))
+
+        # hashes that really run side by side are bound by cores as well as by workers
+        concurrent = max(min(options['workers'], cores // parallelism), 1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'suggested: {elapsed * 1000:.1f}ms per hash, about {concurrent / elapsed:.0f} logins/sec per host\n'
+            f'ARGON2_TIME_COST = {time_cost}\n'
+            f'ARGON2_MEMORY_COST = {memory_cost}\n'
+            f'ARGON2_PARALLELISM = {parallelism}'
+        ))
+
+    # returns the median seconds of one hash with the given costs
+    def measure(self, time_cost, memory_cost, parallelism, samples):
+        hasher = argon2.PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            hasher.hash('password-tuning')
+            timings.append(time.perf_counter() - start)
+
+        elapsed = sorted(timings)[len(timings) // 2]
+        self.stdout.write(f'  time_cost {time_cost}, memory_cost {memory_cost}KiB, parallelism {parallelism}: {elapsed * 1000:.1f}ms')
+        return elapsed
@@ -0,0 +1,39 @@
+import hashlib
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+
+
+# backfills fingerprint hash from the stored device, os and browser families
+def backfill_fingerprint(apps, schema_editor):
+    LoginState = apps.get_model('account', 'LoginState')
+
+    batch = []
+    for login_state in LoginState.objects.only('id', 'device', 'os', 'browser').iterator(chunk_size=BATCH_SIZE):
+        normalized = '\x1f'.join(family.strip().lower() for family in (login_state.device, login_state.os, login_state.browser))
+        login_state.fingerprint = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+        batch.append(login_state)
+
+        if len(batch) == BATCH_SIZE:
+            LoginState.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+
+    if batch:
+        LoginState.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loginstate',
+            name='fingerprint',
+            field=models.CharField(default='', max_length=64),
+        ),
+        migrations.RunPython(backfill_fingerprint, migrations.RunPython.noop),
+    ]
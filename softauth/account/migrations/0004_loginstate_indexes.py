@@ -0,0 +1,29 @@
+# Generated by Django 4.2.5 on 2026-10-18 06:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_revokedsession'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loginstate',
+            index=models.Index(fields=['user', '-created_on'], name='loginstate_user_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='loginstate',
+            name='token',
+            field=models.CharField(default='', max_length=500, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='loginstate',
+            name='user',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
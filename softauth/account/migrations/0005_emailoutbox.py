@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_loginstate_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_email', models.EmailField(max_length=255)),
+                ('from_email', models.CharField(blank=True, default='', max_length=255)),
+                ('reply_to', models.CharField(blank=True, default='', max_length=255)),
+                ('subject', models.CharField(blank=True, default='', max_length=255)),
+                ('body', models.TextField(blank=True, default='')),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('S', 'Sent'), ('F', 'Failed')], default='P', max_length=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_by', models.CharField(blank=True, default='', max_length=32)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_on', models.DateTimeField(blank=True, default=None, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_on'], name='emailoutbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+import uuid
+from django.db import migrations
+import account.fields
+import utils.generator
+from utils import uid as uid_codec
+
+
+# tables with a column referencing user uid
+REFERENCES = [
+    ('account_loginstate', 'user_id'),
+    ('django_admin_log', 'user_id'),
+]
+
+
+# rewrites every uid and its references from old to new values, foreign key checks are deferred to commit
+def rewrite_uids(schema_editor, convert):
+    connection = schema_editor.connection
+    tables = set(connection.introspection.table_names())
+    quote = schema_editor.quote_name
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {quote("uid")} FROM {quote("account_user")}')
+        pairs = [(old, convert(old)) for (old,) in cursor.fetchall()]
+        pairs = [(old, new) for old, new in pairs if old != new]
+
+        for table, column in [('account_user', 'uid')] + [reference for reference in REFERENCES if reference[0] in tables]:
+            cursor.executemany(
+                f'UPDATE {quote(table)} SET {quote(column)} = %s WHERE {quote(column)} = %s',
+                [(new, old) for old, new in pairs],
+            )
+
+        # firing deferred foreign key checks now, postgres refuses to alter tables with pending checks
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+# public uid to 32 hex digits the uuid column conversion accepts
+def uids_to_hex(apps, schema_editor):
+    rewrite_uids(schema_editor, lambda uid: uid_codec.decode(uid).hex)
+
+
+# uuid text in hex or dashed form back to public uid
+def uids_to_public(apps, schema_editor):
+    rewrite_uids(schema_editor, lambda uid: uid_codec.encode(uuid.UUID(str(uid))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(uids_to_hex, uids_to_public),
+        migrations.AlterField(
+            model_name='user',
+            name='uid',
+            field=account.fields.PublicUIDField(default=utils.generator.generate_uuid, primary_key=True, serialize=False, unique=True),
+        ),
+    ]
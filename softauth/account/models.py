@@ -1,30 +1,46 @@
 import string
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
-from utils import generator, security
-from django.conf import settings
+from utils import generator, security, hashing
+from utils.usernames import UsernameAllocator
+from .fields import PublicUIDField
 from django.utils import timezone
 
 
 # User model and manager
 class UserManager(BaseUserManager):
     '''User Manager Class'''
+
+    USERNAME_ATTEMPTS = 3
+
     def __create_user(self, email, first_name, last_name, password=None):
         if not email:
             raise ValueError('Users must have an email address')
 
         # generating uid and username
         uid = generator.generate_uuid()
-        username = generator.generate_username(first_name, last_name)
+        allocator = UsernameAllocator(self.model)
+        username = allocator.allocate(first_name, last_name)
 
         # creating user 
         user = self.model(uid=uid, email=self.normalize_email(email), first_name=first_name, last_name=last_name, username=username)
 
-        # saving user with user password
-        user.set_password(password)
-        user.save(using=self._db)
-
-        return user
+        # saving user with user password hashed on the hashing executor
+        if password is None:
+            user.set_unusable_password()
+        else:
+            user.password = hashing.make_password(password)
+
+        for attempt in range(self.USERNAME_ATTEMPTS):
+            try:
+                with transaction.atomic(using=self._db):
+                    user.save(using=self._db, force_insert=True)
+                return user
+            except IntegrityError:
+                # allocating again only when a concurrent signup took the same username
+                if attempt + 1 == self.USERNAME_ATTEMPTS or not self.model.objects.filter(username=user.username).exists():
+                    raise
+                user.username = allocator.allocate(first_name, last_name)
     
     def create_user_with_profile(self, first_name, last_name, gender, date_of_birth, msg_token, email, password=None):
         first_name = first_name.lower()
@@ -38,7 +54,7 @@ class UserManager(BaseUserManager):
 
         # preparing user encryption key
         enc_key = generator.generate_password_key()
-        aes = security.AES256(settings.SERVER_ENC_KEY)
+        aes = security.server_cipher()
         enc_key = aes.encrypt(enc_key)
 
         # setting user config
@@ -75,7 +91,7 @@ class UserManager(BaseUserManager):
 # user model
 class User(AbstractBaseUser):
     '''User Model Class'''
-    uid = models.CharField(default=generator.generate_uuid(), max_length=36, unique=True, primary_key=True)
+    uid = PublicUIDField(default=generator.generate_uuid, unique=True, primary_key=True)
     first_name = models.CharField(default='', max_length=255)
     last_name = models.CharField(default='', max_length=255)
     email = models.EmailField(default='', max_length=255, unique=True)
@@ -127,14 +143,51 @@ class User(AbstractBaseUser):
 # Login State
 class LoginState(models.Model):
     '''Login State Model Class'''
-    user = models.ForeignKey(User, on_delete=models.CASCADE, editable=False)
-    token = models.CharField(default='', max_length=500)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, editable=False, db_index=False)
+    token = models.CharField(default='', max_length=500, unique=True)
     device = models.CharField(default='', max_length=20)
     os = models.CharField(default='', max_length=20)
     browser = models.CharField(default='', max_length=20)
+    fingerprint = models.CharField(default='', max_length=64)
     created_on = models.DateTimeField(default=None)
     active_until = models.DateTimeField(default=None)
 
+    class Meta:
+        indexes = [
+            # serves per user lookups and newest first session listing, making a separate user index redundant
+            models.Index(fields=['user', '-created_on'], name='loginstate_user_created_idx'),
+        ]
+
     @property
     def is_active(self):
-        return self.active_until >= timezone.now()
\ No newline at end of file
+        return self.active_until >= timezone.now()
+
+
+# Revoked Session
+class RevokedSession(models.Model):
+    '''Revoked Session Model Class, login state ids whose access tokens must be rejected until they expire'''
+    session_id = models.BigIntegerField(db_index=True)
+    revoked_on = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+# Email Outbox
+class EmailOutbox(models.Model):
+    '''Email Outbox Model Class, emails waiting to be sent by the dispatch_emails command'''
+    to_email = models.EmailField(max_length=255)
+    from_email = models.CharField(default='', max_length=255, blank=True)
+    reply_to = models.CharField(default='', max_length=255, blank=True)
+    subject = models.CharField(default='', max_length=255, blank=True)
+    body = models.TextField(default='', blank=True)
+    status = models.CharField(default='P', choices=(('P', 'Pending'), ('S', 'Sent'), ('F', 'Failed')), max_length=1)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_on = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(default='', max_length=32, blank=True)
+    last_error = models.TextField(default='', blank=True)
+    created_on = models.DateTimeField(default=timezone.now)
+    sent_on = models.DateTimeField(default=None, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # serves the dispatcher claim of due pending emails
+            models.Index(fields=['status', 'next_attempt_on'], name='emailoutbox_due_idx'),
+        ]
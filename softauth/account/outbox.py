@@ -0,0 +1,112 @@
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.utils import timezone
+from .models import EmailOutbox
+
+
+class DatabaseOutbox:
+    '''Outbox persisting emails in the EmailOutbox table, written in the caller's transaction and sent by dispatch_emails'''
+
+    def put(self, message):
+        EmailOutbox.objects.create(
+            to_email=message.to[0],
+            from_email=message.from_email or '',
+            reply_to=','.join(message.reply_to),
+            subject=message.subject,
+            body=message.body,
+        )
+        return True
+
+
+database_outbox = DatabaseOutbox()
+
+
+class EmailDispatcher:
+    '''Claims due outbox emails in batches, sends them over one SMTP connection and reschedules failures with backoff'''
+
+    def __init__(self, batch_size, lease_seconds, max_attempts, retry_seconds):
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+
+    # returns claimed due emails, a claim is a lease so emails of a crashed dispatcher are retried once it ends
+    def claim(self):
+        now = timezone.now()
+        claim = uuid.uuid4().hex
+
+        with transaction.atomic():
+            # skipping rows locked by other dispatchers where the database supports row locks
+            ids = list(
+                EmailOutbox.objects.select_for_update(skip_locked=True)
+                .filter(status='P', next_attempt_on__lte=now)
+                .order_by('next_attempt_on')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+
+            # rechecking due time in the update so a row is never claimed by two dispatchers
+            EmailOutbox.objects.filter(id__in=ids, status='P', next_attempt_on__lte=now).update(
+                claimed_by=claim,
+                next_attempt_on=now + timedelta(seconds=self.lease_seconds),
+            )
+
+        return list(EmailOutbox.objects.filter(id__in=ids, claimed_by=claim))
+
+    # sends claimed emails over connection, returns (sent, failed) counts
+    def send(self, emails, connection):
+        sent_ids, failed = [], []
+
+        for email in emails:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email or None,
+                to=[email.to_email],
+                reply_to=[address for address in email.reply_to.split(',') if address],
+            )
+
+            try:
+                # keeping connection open across messages, send_messages alone would reconnect per call
+                connection.open()
+                connection.send_messages([message])
+                sent_ids.append(email.id)
+            except Exception as e:
+                email.last_error = str(e)
+                failed.append(email)
+
+                # reopening connection the server may have dropped
+                connection.close()
+
+        self.record(sent_ids, failed)
+        return len(sent_ids), len(failed)
+
+    # marks sent emails and reschedules failed ones with exponential backoff
+    def record(self, sent_ids, failed):
+        now = timezone.now()
+
+        if sent_ids:
+            EmailOutbox.objects.filter(id__in=sent_ids).update(status='S', sent_on=now, claimed_by='')
+
+        for email in failed:
+            email.attempts += 1
+            email.claimed_by = ''
+            if email.attempts >= self.max_attempts:
+                email.status = 'F'
+            else:
+                email.next_attempt_on = now + timedelta(seconds=self.retry_seconds * 2 ** (email.attempts - 1))
+
+        if failed:
+            EmailOutbox.objects.bulk_update(failed, ['attempts', 'status', 'next_attempt_on', 'claimed_by', 'last_error'])
+
+
+# returns email dispatcher configured from settings
+def email_dispatcher(batch_size=None):
+    return EmailDispatcher(
+        batch_size=batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE,
+        lease_seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS,
+        max_attempts=settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+        retry_seconds=settings.EMAIL_OUTBOX_RETRY_SECONDS,
+    )
@@ -0,0 +1,82 @@
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from utils.bloom import BloomFilter
+from utils.periodic import PeriodicTask
+from .models import RevokedSession
+
+
+class RevocationList:
+    '''In-process Bloom filter of revoked login state ids, refreshed incrementally from the RevokedSession table'''
+
+    OVERLAP_SECONDS = 30
+
+    def __init__(self, capacity, error_rate, refresh_interval, window):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.window = window
+        self.__bloom = None
+        self.__built_on = None
+        self.__refreshed_on = None
+        self.__lock = threading.Lock()
+        self.__task = PeriodicTask(refresh_interval, self.refresh, name='revocation-refresh')
+
+    # revokes the login state ids for every worker
+    def revoke(self, session_ids):
+        session_ids = list(session_ids)
+        if not session_ids:
+            return
+
+        RevokedSession.objects.bulk_create([RevokedSession(session_id=session_id) for session_id in session_ids])
+
+        # making the revocation visible to this worker without waiting for refresh
+        if self.__bloom is not None:
+            self.__bloom.update(session_ids)
+
+    # returns True if login state id is revoked, only filter hits falls back to an exact lookup
+    def is_revoked(self, session_id):
+        if self.__bloom is None:
+            self.refresh()
+            self.__task.start()
+
+        if session_id not in self.__bloom:
+            return False
+
+        return RevokedSession.objects.filter(session_id=session_id).exists()
+
+    # fetches revocations added since last refresh, rebuilds the filter once entries outlive the window
+    def refresh(self):
+        with self.__lock:
+            now = timezone.now()
+
+            if self.__bloom is None or self.__built_on + timedelta(seconds=self.window) <= now:
+                bloom = BloomFilter(self.capacity, self.error_rate)
+                since = now - timedelta(seconds=self.window)
+                self.__built_on = now
+            else:
+                # overlapping previous refresh so rows committed late are never skipped
+                bloom = self.__bloom
+                since = self.__refreshed_on - timedelta(seconds=self.OVERLAP_SECONDS)
+
+            bloom.update(RevokedSession.objects.filter(revoked_on__gte=since).values_list('session_id', flat=True).iterator())
+
+            self.__refreshed_on = now
+            self.__bloom = bloom
+
+    def stats(self):
+        return {
+            'entries': len(self.__bloom) if self.__bloom is not None else 0,
+            'capacity': self.capacity,
+            'built_on': self.__built_on,
+            'refreshed_on': self.__refreshed_on,
+            'refreshing': self.__task.is_running,
+        }
+
+
+revocation_list = RevocationList(
+    capacity=settings.REVOCATION_FILTER_CAPACITY,
+    error_rate=settings.REVOCATION_FILTER_ERROR_RATE,
+    refresh_interval=settings.REVOCATION_REFRESH_SECONDS,
+    window=settings.AUTH_ACCESS_EXPIRE_SECONDS,
+)
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from .models import User
 from utils import validators, otp
+from .services import UserService, LoginService
+from .emails import registered_emails
 from django.core.cache import cache
 
 
@@ -45,7 +47,8 @@ class SignupSerializer(serializers.ModelSerializer):
         if type(msg_token) is not str:
             raise serializers.ValidationError({'token': 'Invalid message token.'})
 
-        if User.objects.filter(email=email).exists():
+        # checking database only for emails the registered email filter can not rule out
+        if registered_emails.might_exist(email) and User.objects.filter(email=email).exists():
             raise serializers.ValidationError({'account': f'Account already exists with this email {email}. Try with another email.'})
 
         if cache.get(email):
@@ -99,16 +102,18 @@ class LoginSerializer(serializers.ModelSerializer):
         if type(msg_token) is not str:
             raise serializers.ValidationError({'token': 'Invalid message token.'})
 
-        if not User.objects.filter(email=email).exists():
+        # fetching user with its sessions once, it is passed on to login through validated data
+        user = LoginService.find_user(email) if registered_emails.might_exist(email) else None
+        if user is None:
             raise serializers.ValidationError({'account': 'No account found.'})
 
-        user = User.objects.get(email=email)
         if not user.is_signed:
             raise serializers.ValidationError({'account': 'Something went wrong!'})
 
         if not user.is_active:
             raise serializers.ValidationError({'account', 'Your account has been deactivated.'})
         
+        attrs['user'] = user
         return attrs
 
 
@@ -127,10 +132,10 @@ class PasswordRecoverySerializer(serializers.ModelSerializer):
         if not validators.is_email(email):
             raise serializers.ValidationError({'email': 'Invalid Email'})
 
-        if not User.objects.filter(email=email).exists():
+        self.user = User.objects.filter(email=email).first() if registered_emails.might_exist(email) else None
+        if self.user is None:
             raise serializers.ValidationError({'account': 'No account found.'})
 
-        self.user = User.objects.get(email=email)
         if not self.user.is_signed:
             raise serializers.ValidationError({'account': 'Something went wrong!'})
 
@@ -197,7 +202,7 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
         if not validators.atleast_length(new_password, 8) or not validators.atmost_length(new_password, 32) or not validators.is_password(new_password):
             raise serializers.ValidationError({'password': 'Password must be of 8 to 32 character, contains atleast one number and one character.'})
         
-        if not self.context.get('user').check_password(password):
+        if not UserService.check_password(self.context.get('user'), password):
             raise serializers.ValidationError({'password': 'Current password is Invalid.'})
         
         return attrs
@@ -234,7 +239,7 @@ class ChangeUserNamesSerializer(serializers.ModelSerializer):
         if not validators.atleast_length(password, 8) or not validators.atmost_length(password, 32) or not validators.is_password(password):
             raise serializers.ValidationError({'password': 'Password must be of 8 to 32 character, contains atleast one number and one character.'})
         
-        if not self.context.get('user').check_password(password):
+        if not UserService.check_password(self.context.get('user'), password):
             raise serializers.ValidationError({'password': 'Invalid Password.'})
         
         return attrs
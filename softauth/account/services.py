@@ -1,13 +1,17 @@
-import user_agents
 from django.conf import settings
 from django.core.cache import cache
-from utils import otp, generator, security
+from utils import otp, generator, security, useragent, hashing
 from utils.platform import Platform
 from utils.messenger import Mailer
 from .jwt_token import Jwt, EncryptedJwt
 from .models import User, LoginState
+from .caches import principal_cache, enc_key_cache, profile_cache, signup_state, recovery_state
+from .revocation import revocation_list
+from .emails import registered_emails
 from .exceptions import UserNotFoundError, NoCacheDataError
-from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 
@@ -19,7 +23,7 @@ class UserService:
 
     @staticmethod
     def create_user(data) -> User:
-        return User.objects.create_user_with_profile(
+        user = User.objects.create_user_with_profile(
             first_name=data.get('first_name'),
             last_name=data.get('last_name'),
             gender=data.get('gender'),
@@ -28,6 +32,8 @@ class UserService:
             email=data.get('email'),
             password=data.get('password'),
         )
+        registered_emails.add(user.email)
+        return user
     
     @staticmethod
     def get_user(uid) -> User:
@@ -51,18 +57,41 @@ class UserService:
 
     @staticmethod
     def update_fcm_token(user, token=''):
+        # skipping the write when the token is unchanged
+        if user.msg_token == token:
+            return
+
         user.msg_token = token
-        user.save()
+        user.save(update_fields=['msg_token'])
+        principal_cache.invalidate(user.uid)
     
     @staticmethod
     def change_password(user, password):
-        user.set_password(password)
-        user.save()
+        user.password = hashing.make_password(password)
+        user.save(update_fields=['password'])
+        principal_cache.invalidate(user.uid)
+
+    @staticmethod
+    def check_password(user, password):
+        is_valid, needs_rehash = hashing.verify_password(password, user.password)
+
+        # upgrading password hashed with outdated hasher parameters, saved on the request thread
+        if needs_rehash:
+            user.password = hashing.make_password(password)
+            user.save(update_fields=['password'])
+
+        return is_valid
     
     @staticmethod
     def get_user_enc_key(user):
-        aes = security.AES256(settings.SERVER_ENC_KEY)
-        enc_key = aes.decrypt(user.enc_key)
+        # decrypted key is reused as long as the stored cipher is unchanged
+        enc_key = enc_key_cache.get(user.uid, user.enc_key)
+
+        if enc_key is None:
+            aes = security.server_cipher()
+            enc_key = aes.decrypt(user.enc_key)
+            enc_key_cache.set(user.uid, user.enc_key, enc_key)
+
         return enc_key
 
     @staticmethod
@@ -76,7 +105,8 @@ class UserService:
         
         user.first_name = first_name.lower()
         user.last_name = last_name.lower()
-        user.save()
+        user.save(update_fields=['username', 'first_name', 'last_name'])
+        principal_cache.invalidate(user.uid)
 
 
 
@@ -85,36 +115,108 @@ class UserService:
 class LoginStateTokenService:
     '''Web Login State Token Service for creating, fetching and deleting login token and it's state'''
     @staticmethod
-    def create(user, user_agent_header, timeout):
-        user_agent = user_agents.parse(user_agent_header)
-        login_token = generator.generate_token()
-
-        login_states = LoginState.objects.filter(user=user).order_by('-created_on')
-        if len(login_states) == 5:
-            login_states[0].delete()
-        
+    def create(user, user_agent_header, timeout, msg_token=None):
+        device, os, browser = useragent.parse(user_agent_header)
         created_on = timezone.now()
-        active_until = created_on + timedelta(seconds=timeout)
-            
-        login_state = LoginState.objects.create(
-            user=user,
-            token=login_token,
-            device=user_agent.device.family,
-            os=user_agent.os.family,
-            browser=user_agent.browser.family,
-            created_on=created_on,
-            active_until=active_until,
-        )
+
+        fields = {
+            'token': generator.generate_token(),
+            'device': device,
+            'os': os,
+            'browser': browser,
+            'fingerprint': useragent.fingerprint(user_agent_header),
+            'created_on': created_on,
+            'active_until': created_on + timedelta(seconds=timeout),
+        }
+
+        # login time and a changed messaging token are written to the user row in one update
+        changes = {'last_login': created_on}
+        if msg_token is not None and msg_token != user.msg_token:
+            changes['msg_token'] = msg_token
+
+        # session count and oldest session read with the user by LoginService.find_user
+        sessions = getattr(user, 'login_sessions', None)
+        oldest_session = getattr(user, 'oldest_session', None)
+
+        with transaction.atomic():
+            # updating the user row locks it, so concurrent logins of user go one after another
+            # the sessions read with the user still hold when no other login came in since, otherwise they are counted again
+            if sessions is None or not User.objects.filter(pk=user.pk, last_login=user.last_login).update(**changes):
+                User.objects.filter(pk=user.pk).update(**changes)
+                sessions = LoginState.objects.filter(user=user).count()
+                oldest_session = None
+
+            login_state = None
+
+            # reusing the oldest session row at the limit, one update in place of an insert and a delete
+            # two token mode puts session ids in tokens, so there the oldest session is deleted and revoked instead
+            if sessions == settings.MAX_LOGIN_SESSIONS and oldest_session is not None and not settings.AUTH_TWO_TOKEN_MODE:
+                if LoginState.objects.filter(id=oldest_session, user=user).update(**fields):
+                    login_state = LoginState(id=oldest_session, user=user, **fields)
+                    principal_cache.invalidate(user.uid)
+                else:
+                    # the oldest session was logged out meanwhile
+                    sessions -= 1
+
+            if login_state is None:
+                login_state = LoginState.objects.create(user=user, **fields)
+
+                # keeping only the newest sessions of user
+                if sessions >= settings.MAX_LOGIN_SESSIONS:
+                    LoginStateTokenService.trim(user, sessions + 1 - settings.MAX_LOGIN_SESSIONS)
+
+        for field, value in changes.items():
+            setattr(user, field, value)
+
+        if 'msg_token' in changes:
+            principal_cache.invalidate(user.uid)
 
         return login_state
+
+    @staticmethod
+    def trim(user, count):
+        # ids of the oldest count sessions, read through the (user, created_on) index
+        # a bounded list instead of a limited subquery, which MySQL does not allow inside IN
+        stale_ids = list(LoginState.objects.filter(user=user).order_by('created_on', 'id').values_list('id', flat=True)[:count])
+        if not stale_ids:
+            return 0
+
+        deleted, _ = LoginState.objects.filter(id__in=stale_ids).delete()
+
+        # access tokens of stale sessions must be rejected only in two token mode, others are checked against their login state
+        if settings.AUTH_TWO_TOKEN_MODE:
+            revocation_list.revoke(stale_ids)
+
+        principal_cache.invalidate(user.uid)
+        return deleted
     
     @staticmethod
     def get(user, token):
         return LoginState.objects.get(user=user, token=token)
 
+    @staticmethod
+    def get_with_user(token):
+        # resolving login state and its user in one query using the unique token index
+        return LoginState.objects.select_related('user').get(token=token)
+
+    @staticmethod
+    def get_active(sid, uid, token, user_agent_header):
+        login_state = LoginState.objects.select_related('user').filter(id=sid, user_id=uid, token=token).first()
+
+        if login_state is None or not login_state.is_active or not login_state.user.is_active or login_state.fingerprint != useragent.fingerprint(user_agent_header):
+            return None
+
+        return login_state
+
     @staticmethod
     def delete(user, token):
-        LoginStateTokenService.get(user=user, token=token).delete()
+        login_state = LoginStateTokenService.get(user=user, token=token)
+        session_id = login_state.id
+        login_state.delete()
+
+        # rejecting access tokens issued for this login state
+        if settings.AUTH_TWO_TOKEN_MODE:
+            revocation_list.revoke([session_id])
 
 
 
@@ -133,12 +235,12 @@ class SignupService:
         id = generator.generate_identity()
 
         # adding encrypted password an hasted otp to data dict
-        aes = security.AES256(settings.SERVER_ENC_KEY)
+        aes = security.server_cipher()
         data['password'] = aes.encrypt(password)
         data['otp'] = hashed_otp
 
         # putting data into cache for validation
-        cache.set(f'{id}:signup', data, timeout=settings.SIGNUP_EXPIRE_SECONDS)
+        cache.set(f'{id}:signup', signup_state.encode(data), timeout=settings.SIGNUP_EXPIRE_SECONDS)
 
         # generating signup otp token
         if platform == Platform.MOBILE:
@@ -178,7 +280,7 @@ class SignupService:
     
     @staticmethod
     def retrieve_signup_cache_data(id):
-        data = cache.get(f'{id}:signup')
+        data = signup_state.decode(cache.get(f'{id}:signup'))
         if not data:
             raise NoCacheDataError()
         return data
@@ -190,7 +292,7 @@ class SignupService:
     @staticmethod
     def create_user(data):
         # retriving hashed otp and decrypting password and changing the data dict password key value
-        aes = security.AES256(settings.SERVER_ENC_KEY)
+        aes = security.server_cipher()
         data['password'] = aes.decrypt(data['password'])
 
         # creating user with user profile
@@ -224,7 +326,7 @@ class SignupService:
         data['otp'] = hashed_otp
 
         # putting data into cache for validation
-        cache.set(f'{id}:signup', data, timeout=settings.SIGNUP_EXPIRE_SECONDS)
+        cache.set(f'{id}:signup', signup_state.encode(data), timeout=settings.SIGNUP_EXPIRE_SECONDS)
 
         # creating new signup otp token
         if platform == Platform.MOBILE:
@@ -252,37 +354,71 @@ class LoginService:
 
     @staticmethod
     def __login_authentication(data):
-        return authenticate(email=data.get('email'), password=data.get('password'))
+        # user was fetched and checked to be active by the login serializer
+        user = data.get('user')
+
+        # checking password on the hashing executor
+        if user is None or not user.is_active or not UserService.check_password(user, data.get('password')):
+            return None
+        return user
         
 
     @staticmethod
     def login(data):
-        user = LoginService.__login_authentication(data)
-        if user is not None:
-            # updating messaging token
-            UserService.update_fcm_token(user, data.get('msg_token'))
-        
-        return user
+        return LoginService.__login_authentication(data)
+
+    # returns user of email with its session count as login_sessions and oldest session id as oldest_session, fetched in one query
+    @staticmethod
+    def find_user(email):
+        sessions = LoginState.objects.filter(user=OuterRef('pk')).order_by()
+        return User.objects.annotate(
+            login_sessions=Coalesce(Subquery(sessions.values('user').annotate(count=Count('id')).values('count')), 0),
+            oldest_session=Subquery(sessions.order_by('created_on', 'id').values('id')[:1]),
+        ).filter(email=email).first()
     
     @staticmethod
-    def generate_auth_token(user: User, request, platform=Platform.MOBILE):
-        # creating login state
+    def __generate_token(type, data, seconds, platform=Platform.MOBILE):
+        if platform == Platform.MOBILE:
+            return Jwt.generate(type=type, data=data, seconds=seconds)
+        return EncryptedJwt.generate(type=type, data=data, seconds=seconds)
+
+    @staticmethod
+    def generate_access_token(login_state: LoginState, platform=Platform.MOBILE):
+        # short lived access token carrying everything authentication needs, so no database lookup is required
+        data = {
+            'uid': login_state.user_id,
+            'sid': login_state.id,
+            'fp': login_state.fingerprint[:16],
+        }
+        return LoginService.__generate_token('LA', data, settings.AUTH_ACCESS_EXPIRE_SECONDS, platform)
+    
+    @staticmethod
+    def generate_auth_token(user: User, request, platform=Platform.MOBILE, msg_token=None):
+        # creating login state and updating messaging token in one transaction
         login_state = LoginStateTokenService.create(
             user=user,
             user_agent_header=request.META['HTTP_USER_AGENT'],
-            timeout=settings.AUTH_EXPIRE_SECONDS
+            timeout=settings.AUTH_EXPIRE_SECONDS,
+            msg_token=msg_token,
         )
         login_token = login_state.token
 
-        # creating logged in authenticatin token
-        if platform == Platform.MOBILE:
-            auth_token = Jwt.generate(type='LI', data={'uid': user.uid}, seconds=settings.AUTH_EXPIRE_SECONDS)
-        else:
-            auth_token = EncryptedJwt.generate(type='LI', data={'uid': user.uid}, seconds=settings.AUTH_EXPIRE_SECONDS)
-
         # getting user encryption key
         enc_key = UserService.get_user_enc_key(user)
 
+        # creating access and refresh token pair in two token mode
+        if settings.AUTH_TWO_TOKEN_MODE:
+            return {
+                'uid': user.uid,
+                'at': LoginService.generate_access_token(login_state, platform),
+                'rt': LoginService.__generate_token('LR', {'uid': user.uid, 'sid': login_state.id}, settings.AUTH_EXPIRE_SECONDS, platform),
+                'lst': login_token,
+                'enc_key': enc_key,
+            }
+
+        # creating logged in authenticatin token
+        auth_token = LoginService.__generate_token('LI', {'uid': user.uid}, settings.AUTH_EXPIRE_SECONDS, platform)
+
         return { 
             'uid': user.uid,
             'at': auth_token,
@@ -290,10 +426,44 @@ class LoginService:
             'enc_key': enc_key,
         }
 
+    @staticmethod
+    def verify_refresh_token(request, platform=Platform.MOBILE):
+        # retriving headers data
+        if platform == Platform.MOBILE:
+            _rt = request.META.get('HTTP_RT')
+            success, payload = Jwt.validate(_rt)
+        else:
+            _rt = request.COOKIES.get('rt')
+            success, payload = EncryptedJwt.validate(_rt)
+
+        # validating token
+        is_verified = success and payload.get('type') == 'LR' and payload['data']['uid'] == request.META.get('HTTP_UID')
+        sid = payload['data']['sid'] if is_verified else None
+
+        return is_verified, sid
+
+    @staticmethod
+    def refresh_auth_token(sid, request, platform=Platform.MOBILE):
+        # validating login state backing the refresh token
+        login_state = LoginStateTokenService.get_active(
+            sid=sid,
+            uid=request.META.get('HTTP_UID'),
+            token=request.META['HTTP_LST'],
+            user_agent_header=request.META['HTTP_USER_AGENT'],
+        )
+
+        if login_state is None:
+            return None
+
+        return {
+            'at': LoginService.generate_access_token(login_state, platform),
+        }
+
     @staticmethod
     def logout(user, platform_lst_token=None):
-        # deleting login state
+        # deleting login state and cached authenticated user
         LoginStateTokenService.delete(user=user, token=platform_lst_token)
+        principal_cache.invalidate(user.uid)
             
         # removing msg_token from user
         UserService.update_fcm_token(user=user)
@@ -315,7 +485,7 @@ class PasswordRecoveryService:
         data['otp'] = hashed_otp
 
         # creating password recovery session
-        cache.set(f'{user.uid}:pr', data, timeout=settings.PASSWORD_RECOVERY_EXPIRE_SECONDS)
+        cache.set(f'{user.uid}:pr', recovery_state.encode(data), timeout=settings.PASSWORD_RECOVERY_EXPIRE_SECONDS)
 
         # creating password recovery token
         if platform == Platform.MOBILE:
@@ -355,7 +525,7 @@ class PasswordRecoveryService:
     
     @staticmethod
     def retrieve_recovery_cache_data(uid):
-        data = cache.get(f'{uid}:pr')
+        data = recovery_state.decode(cache.get(f'{uid}:pr'))
         if not data:
             raise NoCacheDataError()
         return data
@@ -422,7 +592,7 @@ class PasswordRecoveryService:
         data['otp'] = hashed_otp
 
         # assiging new data to password recovery session
-        cache.set(f'{uid}:pr', data, timeout=settings.PASSWORD_RECOVERY_EXPIRE_SECONDS)
+        cache.set(f'{uid}:pr', recovery_state.encode(data), timeout=settings.PASSWORD_RECOVERY_EXPIRE_SECONDS)
 
         # generating new password recovery token
         if platform == Platform.MOBILE:
@@ -452,6 +622,11 @@ class ProfileService:
     def generate_user_profile(uid):
         '''user - logged in user, uid - user uid who's profile is to be generated.'''
 
+        # returning profile cached by any worker
+        response = profile_cache.get(uid)
+        if response is not None:
+            return response
+
         user = UserService.get_user(uid)
 
         # profile json response
@@ -471,6 +646,7 @@ class ProfileService:
             },
         }
 
+        profile_cache.set(uid, response)
         return response
 
     @staticmethod
@@ -481,8 +657,9 @@ class ProfileService:
         user.bio = data.get('bio')
         user.website = data.get('website')
 
-        # saving profile
-        user.save()
+        # saving only the profile fields, user may be a cached copy older than its row
+        user.save(update_fields=['message', 'location', 'interest', 'bio', 'website'])
+        principal_cache.invalidate(user.uid)
 
         return {
             'type': user.acc_type,
@@ -503,5 +680,6 @@ class ProfileService:
     @staticmethod
     def update_profile_photo(user: User, data):
         user.photo = data.get('photo')
-        user.save()
+        user.save(update_fields=['photo'])
+        principal_cache.invalidate(user.uid)
         return { 'photo': user.photo.url }
\ No newline at end of file
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import User
+from .caches import profile_cache
+
+
+PROFILE_FIELDS = frozenset(('acc_type', 'first_name', 'last_name', 'username', 'photo', 'gender', 'message', 'bio', 'interest', 'website', 'location'))
+
+
+# removing cached profile of user whenever a save may change it, including admin and shell edits
+@receiver(post_save, sender=User)
+def invalidate_profile_on_save(sender, instance, created=False, update_fields=None, **kwargs):
+    if not created and (update_fields is None or not PROFILE_FIELDS.isdisjoint(update_fields)):
+        profile_cache.delete(instance.uid)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_profile_on_delete(sender, instance, **kwargs):
+    profile_cache.delete(instance.uid)
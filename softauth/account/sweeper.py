@@ -0,0 +1,91 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from utils.periodic import PeriodicTask
+from .models import LoginState, RevokedSession
+
+
+class BatchSweeper:
+    '''Deletes rows matching a filter in bounded primary key ranges so no delete holds long locks'''
+
+    def __init__(self, model, expired_filter, batch_size):
+        self.model = model
+        self.expired_filter = expired_filter
+        self.batch_size = batch_size
+
+    # deletes expired rows from start_pk onwards, yields (next cursor, deleted rows) after every batch
+    # next cursor is None once the end of table is reached
+    def sweep(self, start_pk=0, max_batches=None):
+        end_pk = self.model.objects.aggregate(end=Max('pk'))['end']
+        cursor = self.model.objects.filter(pk__gte=start_pk).aggregate(start=Min('pk'))['start']
+        batches = 0
+
+        while cursor is not None and cursor <= end_pk and (max_batches is None or batches < max_batches):
+            upper = cursor + self.batch_size
+
+            with transaction.atomic():
+                deleted, _ = self.model.objects.filter(pk__gte=cursor, pk__lt=upper).filter(**self.expired_filter()).delete()
+
+            # jumping over primary key gaps left by earlier sweeps
+            cursor = self.model.objects.filter(pk__gte=upper, pk__lte=end_pk).aggregate(start=Min('pk'))['start']
+            batches += 1
+
+            yield (cursor, deleted)
+
+
+# returns login state sweeper deleting sessions past active_until
+def login_state_sweeper(batch_size=None):
+    return BatchSweeper(
+        model=LoginState,
+        expired_filter=lambda: {'active_until__lt': timezone.now()},
+        batch_size=batch_size or settings.LOGIN_STATE_SWEEP_BATCH_SIZE,
+    )
+
+
+# returns revoked session sweeper deleting revocations no access token can outlive
+def revoked_session_sweeper(batch_size=None):
+    return BatchSweeper(
+        model=RevokedSession,
+        expired_filter=lambda: {'revoked_on__lt': timezone.now() - timedelta(seconds=2 * settings.AUTH_ACCESS_EXPIRE_SECONDS)},
+        batch_size=batch_size or settings.LOGIN_STATE_SWEEP_BATCH_SIZE,
+    )
+
+
+class PeriodicSweep:
+    '''In-process periodic sweep running a bounded number of batches per run and resuming from its cursor'''
+
+    def __init__(self, interval, max_batches):
+        self.max_batches = max_batches
+        self.cursors = {}
+        self.deleted = 0
+        self.rates = {}
+        self.task = PeriodicTask(interval, self.run, name='login-state-sweeper')
+
+    def run(self):
+        for sweeper in (login_state_sweeper(), revoked_session_sweeper()):
+            name = sweeper.model.__name__
+            cursor, deleted, start = None, 0, time.perf_counter()
+
+            for cursor, batch_deleted in sweeper.sweep(start_pk=self.cursors.get(name, 0), max_batches=self.max_batches):
+                deleted += batch_deleted
+
+            # starting over from the beginning once the end of table is reached
+            self.cursors[name] = cursor or 0
+            self.deleted += deleted
+            self.rates[name] = deleted / max(time.perf_counter() - start, 1e-6)
+
+    def stats(self):
+        return {
+            'cursors': dict(self.cursors),
+            'deleted': self.deleted,
+            'rows_per_second': dict(self.rates),
+        }
+
+
+periodic_sweep = PeriodicSweep(
+    interval=settings.LOGIN_STATE_SWEEP_SECONDS or 0,
+    max_batches=settings.LOGIN_STATE_SWEEP_MAX_BATCHES,
+)
@@ -1,3 +1,547 @@
-from django.test import TestCase
+import io
+import json
+import os
+import smtplib
+import tempfile
+import time
+import bcrypt
+import jwt
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection
+from django.core.management import call_command, CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from utils import otp, useragent
+from utils.outbox import EmailOutbox
+from utils.security import AES256, Keyring, server_cipher
+from .emails import RegisteredEmails, registered_emails
+from .jwt_token import JwtVerifier
+from .models import User, LoginState, RevokedSession
+from .services import UserService, LoginService, LoginStateTokenService, ProfileService
 
-# Create your tests here.
+
+# tests run on a local memory cache of their own, so clearing it never touches the configured one,
+# and with a fast hasher so they do not pay the tuned Argon2 cost
+test_settings = override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'softauth-tests'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36'
+
+
+@test_settings
+class LoginTestCase(TestCase):
+    PASSWORD = 'abcd1234'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user_with_profile('john', 'doe', 'M', '2000-01-01', 'token', 'john@example.com', self.PASSWORD)
+
+        # the registered email filter is never built in tests
+        patcher = mock.patch.object(registered_emails, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, msg_token='token', user_agent=USER_AGENT):
+        response = self.client.post(
+            '/api/account/v1/login/',
+            json.dumps({'email': 'john@example.com', 'password': self.PASSWORD, 'msg_token': msg_token}),
+            content_type='application/json',
+            HTTP_SEAK=settings.SOFTAUTH_API_KEY,
+            HTTP_USER_AGENT=user_agent,
+        )
+        self.assertTrue(response.json()['success'])
+        return response
+
+
+class LoginQueryTest(LoginTestCase):
+
+    # asserts the statements reading or writing rows, transaction control statements are left out
+    @contextmanager
+    def assertDataQueries(self, count):
+        with CaptureQueriesContext(connection) as context:
+            yield
+
+        statements = [query['sql'] for query in context.captured_queries if not query['sql'].upper().startswith(('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(statements), count, '\n'.join(statements))
+
+    def sessions(self):
+        return LoginState.objects.filter(user=self.user).count()
+
+    def fill_sessions(self):
+        for _ in range(settings.MAX_LOGIN_SESSIONS):
+            self.login()
+        return list(LoginState.objects.filter(user=self.user).order_by('-id').values_list('id', flat=True)[:settings.MAX_LOGIN_SESSIONS - 1])
+
+    def test_login_below_session_limit(self):
+        # fetching user with its sessions, updating its login time and inserting the login state
+        with self.assertDataQueries(3):
+            self.login()
+
+    def test_login_updating_msg_token(self):
+        with self.assertDataQueries(3):
+            self.login(msg_token='rotated')
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.msg_token, 'rotated')
+
+    def test_login_at_session_limit(self):
+        newest = self.fill_sessions()
+
+        # reusing the oldest login state row
+        with self.assertDataQueries(3):
+            tokens = self.login().json()['data']
+
+        self.assertEqual(self.sessions(), settings.MAX_LOGIN_SESSIONS)
+        self.assertEqual(LoginState.objects.filter(id__in=newest).count(), settings.MAX_LOGIN_SESSIONS - 1)
+        self.assertTrue(LoginState.objects.filter(token=tokens['lst']).exists())
+
+    def test_login_at_session_limit_updating_msg_token(self):
+        newest = self.fill_sessions()
+
+        with self.assertDataQueries(3):
+            self.login(msg_token='rotated')
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.msg_token, 'rotated')
+        self.assertEqual(self.sessions(), settings.MAX_LOGIN_SESSIONS)
+        self.assertEqual(LoginState.objects.filter(id__in=newest).count(), settings.MAX_LOGIN_SESSIONS - 1)
+
+    @override_settings(AUTH_TWO_TOKEN_MODE=True)
+    def test_two_token_login_at_session_limit_revokes_oldest(self):
+        self.fill_sessions()
+        oldest = LoginState.objects.filter(user=self.user).order_by('created_on', 'id').first()
+
+        self.login()
+
+        self.assertEqual(self.sessions(), settings.MAX_LOGIN_SESSIONS)
+        self.assertFalse(LoginState.objects.filter(id=oldest.id).exists())
+        self.assertTrue(RevokedSession.objects.filter(session_id=oldest.id).exists())
+
+    def test_login_since_user_was_read_is_counted(self):
+        for _ in range(settings.MAX_LOGIN_SESSIONS - 1):
+            self.login()
+
+        # both users are read with room for one more session
+        user = LoginService.find_user('john@example.com')
+        other = LoginService.find_user('john@example.com')
+        LoginStateTokenService.create(other, USER_AGENT, settings.AUTH_EXPIRE_SECONDS)
+        LoginStateTokenService.create(user, USER_AGENT, settings.AUTH_EXPIRE_SECONDS)
+
+        self.assertEqual(self.sessions(), settings.MAX_LOGIN_SESSIONS)
+
+    def test_login_trims_many_stale_sessions(self):
+        now = timezone.now()
+        LoginState.objects.bulk_create([
+            LoginState(user=self.user, token=f'stale{index}', created_on=now - timedelta(minutes=index), active_until=now)
+            for index in range(30)
+        ])
+
+        tokens = self.login().json()['data']
+
+        self.assertEqual(self.sessions(), settings.MAX_LOGIN_SESSIONS)
+        self.assertTrue(LoginState.objects.filter(token=tokens['lst']).exists())
+        self.assertEqual(set(LoginState.objects.filter(token__startswith='stale').values_list('token', flat=True)), {f'stale{index}' for index in range(settings.MAX_LOGIN_SESSIONS - 1)})
+
+
+class DeviceFingerprintTest(LoginTestCase):
+
+    def check(self, tokens, user_agent):
+        return self.client.get(
+            '/api/account/v1/login/check/',
+            HTTP_SEAK=settings.SOFTAUTH_API_KEY,
+            HTTP_USER_AGENT=user_agent,
+            HTTP_AUTHORIZATION=tokens['at'],
+            HTTP_UID=tokens['uid'],
+            HTTP_LST=tokens['lst'],
+        ).status_code
+
+    def test_login_state_stores_fingerprint(self):
+        tokens = self.login().json()['data']
+
+        login_state = LoginState.objects.get(token=tokens['lst'])
+        self.assertEqual(login_state.fingerprint, useragent.hash_families(login_state.device, login_state.os, login_state.browser))
+
+    def test_browser_update_keeps_session(self):
+        tokens = self.login().json()['data']
+
+        self.assertEqual(self.check(tokens, USER_AGENT.replace('Chrome/117.0.0.0', 'Chrome/118.0.0.0')), 200)
+
+    def test_other_device_is_rejected(self):
+        tokens = self.login().json()['data']
+
+        other = 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1'
+        self.assertEqual(self.check(tokens, other), 401)
+
+
+@test_settings
+class StaleUserWriteTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user_with_profile('john', 'doe', 'M', '2000-01-01', 'token', 'john@example.com', 'abcd1234')
+
+        # another request changing the row after this copy was cached
+        User.objects.filter(pk=self.user.pk).update(msg_token='newer', is_active=False)
+
+    def test_change_password_keeps_newer_columns(self):
+        UserService.change_password(self.user, 'efgh5678')
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(user.check_password('efgh5678'))
+        self.assertEqual((user.msg_token, user.is_active), ('newer', False))
+
+    def test_change_names_keeps_newer_columns(self):
+        UserService.change_names(self.user, 'johnny', 'doe', 'johnny_doe')
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.first_name, user.username), ('johnny', 'johnny_doe'))
+        self.assertEqual((user.msg_token, user.is_active), ('newer', False))
+
+
+class JwtVerifierTest(SimpleTestCase):
+    SECRET = 'secret'
+
+    def setUp(self):
+        self.verifier = JwtVerifier(self.SECRET)
+        self.payload = {'type': 'LI', 'data': {'uid': 'john'}, 'exp': int(time.time()) + 60}
+
+    def test_round_trip(self):
+        self.assertEqual(self.verifier.decode(self.verifier.encode(self.payload)), self.payload)
+
+    def test_forged_signature(self):
+        token = jwt.encode(self.payload, 'other', algorithm='HS256')
+        with self.assertRaises(ValueError):
+            self.verifier.decode(token)
+
+    def test_tampered_payload(self):
+        header, _, signature = self.verifier.encode(self.payload).split('.')
+        forged = jwt.encode(dict(self.payload, data={'uid': 'jane'}), 'other', algorithm='HS256').split('.')[1]
+        with self.assertRaises(ValueError):
+            self.verifier.decode(f'{header}.{forged}.{signature}')
+
+    def test_expired(self):
+        with self.assertRaises(ValueError):
+            self.verifier.decode(self.verifier.encode(dict(self.payload, exp=int(time.time()) - 1)))
+
+    def test_other_header_goes_through_pyjwt(self):
+        token = jwt.encode(self.payload, self.SECRET, algorithm='HS256', headers={'kid': 'k1'})
+        self.assertEqual(self.verifier.decode(token), self.payload)
+
+        with self.assertRaises(ValueError):
+            self.verifier.decode(jwt.encode(self.payload, None, algorithm='none'))
+
+
+class KeyringTest(SimpleTestCase):
+    RAWS = ['key0', '', 'k' * 100, 'key3']
+
+    def setUp(self):
+        self.keyring = Keyring({'k1': 'first', 'k2': 'second'}, 'k2', legacy_key='legacy')
+
+    def test_round_trip(self):
+        cipher = self.keyring.encrypt('key')
+
+        self.assertTrue(cipher.startswith('v1.k2.'))
+        self.assertEqual(self.keyring.decrypt(cipher), 'key')
+
+    def test_batch_round_trip(self):
+        ciphers = self.keyring.encrypt_many(self.RAWS)
+
+        self.assertEqual(self.keyring.decrypt_many(ciphers), self.RAWS)
+        self.assertEqual([self.keyring.decrypt(cipher) for cipher in reversed(ciphers)], self.RAWS[::-1])
+
+    def test_mixed_keys(self):
+        old = Keyring({'k1': 'first'}, 'k1', legacy_key='legacy')
+        ciphers = [old.encrypt('a'), self.keyring.encrypt('b'), AES256('legacy').encrypt('c')]
+
+        self.assertEqual(self.keyring.decrypt_many(ciphers), ['a', 'b', 'c'])
+        self.assertEqual([self.keyring.needs_rotation(cipher) for cipher in ciphers], [True, False, True])
+
+    def test_tampered_cipher(self):
+        cipher = self.keyring.encrypt_many(self.RAWS)[2]
+        tampered = cipher[:-20] + ('A' if cipher[-20] != 'A' else 'B') + cipher[-19:]
+
+        with self.assertRaises(ValueError):
+            self.keyring.decrypt(tampered)
+
+    def test_cipher_moved_to_another_key_id(self):
+        # both key ids hold the same key, only the authenticated prefix tells them apart
+        keyring = Keyring({'k1': 'same', 'k2': 'same'}, 'k1', legacy_key='legacy')
+        cipher = keyring.encrypt('key')
+
+        with self.assertRaises(ValueError):
+            keyring.decrypt(cipher.replace('v1.k1.', 'v1.k2.'))
+
+
+class OTPHasherTest(SimpleTestCase):
+
+    def tearDown(self):
+        otp.get_hasher.cache_clear()
+        otp._hasher_of.cache_clear()
+
+    def test_generated_otp_verifies(self):
+        OTP, hashOTP = otp.generate()
+
+        self.assertRegex(OTP, r'^\d{6}$')
+        self.assertTrue(hashOTP.startswith('hmac$'))
+        self.assertTrue(otp.compare(OTP, hashOTP))
+        self.assertFalse(otp.compare(f'{(int(OTP) + 1) % 10 ** 6:06d}', hashOTP))
+
+    def test_equal_otps_get_distinct_digests(self):
+        hasher = otp.get_hasher()
+        self.assertNotEqual(hasher.encode('123456'), hasher.encode('123456'))
+
+    def test_bcrypt_otps_verify_after_switch(self):
+        hashOTP = bcrypt.hashpw(b'123456', bcrypt.gensalt(4)).decode('utf-8')
+
+        self.assertTrue(otp.compare('123456', hashOTP))
+        self.assertFalse(otp.compare('654321', hashOTP))
+
+    @override_settings(OTP_HASHER='utils.otp.BcryptOTPHasher')
+    def test_bcrypt_hasher_setting(self):
+        otp.get_hasher.cache_clear()
+        otp._hasher_of.cache_clear()
+
+        OTP, hashOTP = otp.generate()
+        self.assertTrue(hashOTP.startswith('$2b$'))
+        self.assertTrue(otp.compare(OTP, hashOTP))
+
+    def test_malformed_digest(self):
+        for hashOTP in ('', 'hmac$', 'md5$x$y', 'plain'):
+            self.assertFalse(otp.compare('123456', hashOTP))
+
+
+@test_settings
+class ProfileCacheTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user_with_profile('john', 'doe', 'M', '2000-01-01', '', 'john@example.com', 'abcd1234')
+        User.objects.filter(pk=self.user.pk).update(photo='profile/photo/john.png')
+        ProfileService.generate_user_profile(self.user.uid)
+
+    def bio(self):
+        return ProfileService.generate_user_profile(self.user.uid)['profile']['bio']
+
+    def test_edit_outside_services_invalidates_profile(self):
+        # as the admin or a shell would save it
+        user = User.objects.get(pk=self.user.pk)
+        user.bio = 'edited'
+        user.save()
+
+        self.assertEqual(self.bio(), 'edited')
+
+    def test_save_of_other_fields_keeps_profile(self):
+        User.objects.filter(pk=self.user.pk).update(bio='unseen')
+        self.user.save(update_fields=['msg_token'])
+
+        self.assertEqual(self.bio(), '')
+
+
+@test_settings
+class RegisteredEmailsTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_user_with_profile('john', 'doe', 'M', '2000-01-01', '', 'john@example.com', 'abcd1234')
+
+        # one filter per worker, refreshed by hand
+        self.worker, self.other_worker = [RegisteredEmails(capacity=1000, error_rate=0.001, refresh_interval=5, rebuild_interval=60) for _ in range(2)]
+        for registered in (self.worker, self.other_worker):
+            registered.refresh()
+
+    def create(self, email):
+        return User.objects.create_user_with_profile('jane', 'doe', 'F', '2000-01-01', '', email, 'abcd1234')
+
+    def test_negatives_skip_the_database(self):
+        with self.assertNumQueries(0):
+            self.assertTrue(self.worker.might_exist('John@Example.com'))
+            self.assertFalse(self.worker.might_exist('nobody@example.com'))
+
+    def test_user_registered_on_other_worker_before_refresh(self):
+        self.create('jane@example.com')
+        self.other_worker.add('jane@example.com')
+
+        self.assertTrue(self.worker.might_exist('jane@example.com'))
+
+    def test_incremental_refresh_reads_new_users(self):
+        self.create('jane@example.com')
+        self.worker.refresh()
+
+        self.assertTrue(self.worker.might_exist('jane@example.com'))
+
+    def test_rebuild_recovers_users_missed_by_refresh(self):
+        # committed late with a created_at the incremental refresh overlap does not reach
+        user = self.create('late@example.com')
+        User.objects.filter(pk=user.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+        self.worker.refresh()
+        self.assertFalse(self.worker.might_exist('late@example.com'))
+
+        self.worker.rebuild_interval = 0
+        self.worker.refresh()
+        self.assertTrue(self.worker.might_exist('late@example.com'))
+
+
+class FakeSMTPBackend(BaseEmailBackend):
+    '''Email backend standing in for an SMTP server, refusing bad@x.com and dropping the connection on request'''
+
+    delivered = []
+    calls = []
+    disconnects = 0
+    disconnects_on = {}
+
+    def send_messages(self, messages):
+        FakeSMTPBackend.calls.append([message.to[0] for message in messages])
+
+        for message in messages:
+            if FakeSMTPBackend.disconnects:
+                FakeSMTPBackend.disconnects -= 1
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+            if FakeSMTPBackend.disconnects_on.get(message.to[0]):
+                FakeSMTPBackend.disconnects_on[message.to[0]] -= 1
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+
+            if 'bad@x.com' in message.to:
+                raise smtplib.SMTPRecipientsRefused({'bad@x.com': (550, b'No such user')})
+
+            FakeSMTPBackend.delivered.append(message.to[0])
+        return len(messages)
+
+
+@override_settings(EMAIL_BACKEND='account.tests.FakeSMTPBackend')
+class EmailOutboxTest(SimpleTestCase):
+    RECIPIENTS = ['a@x.com', 'b@x.com', 'bad@x.com', 'c@x.com', 'd@x.com']
+
+    def setUp(self):
+        FakeSMTPBackend.delivered = []
+        FakeSMTPBackend.calls = []
+        FakeSMTPBackend.disconnects = 0
+        FakeSMTPBackend.disconnects_on = {}
+        self.outbox = EmailOutbox(workers=1, batch_size=10, max_queue=100, idle_timeout=1)
+
+    def send(self):
+        for recipient in self.RECIPIENTS:
+            self.outbox.put(EmailMessage(subject='otp', body='123456', to=[recipient]))
+        self.outbox.flush()
+
+    def test_refused_recipient_does_not_stop_batch(self):
+        self.send()
+
+        self.assertEqual(FakeSMTPBackend.delivered, ['a@x.com', 'b@x.com', 'c@x.com', 'd@x.com'])
+        stats = self.outbox.stats()
+        self.assertEqual((stats['sent'], stats['failed'], stats['connections']), (4, 1, 1))
+
+    def test_dropped_connection_retries_unsent_message_only(self):
+        FakeSMTPBackend.disconnects = 1
+        self.send()
+
+        self.assertEqual(FakeSMTPBackend.delivered, ['a@x.com', 'b@x.com', 'c@x.com', 'd@x.com'])
+        stats = self.outbox.stats()
+        self.assertEqual((stats['sent'], stats['failed'], stats['connections']), (4, 1, 2))
+
+    def test_messages_are_sent_one_by_one(self):
+        self.send()
+
+        self.assertEqual(FakeSMTPBackend.calls, [[recipient] for recipient in self.RECIPIENTS])
+
+    def test_dropped_connection_mid_batch_resends_that_message_only(self):
+        FakeSMTPBackend.disconnects_on = {'c@x.com': 1}
+        self.send()
+
+        # messages sent before the drop are not sent again
+        self.assertEqual(FakeSMTPBackend.calls, [['a@x.com'], ['b@x.com'], ['bad@x.com'], ['c@x.com'], ['c@x.com'], ['d@x.com']])
+        self.assertEqual(FakeSMTPBackend.delivered, ['a@x.com', 'b@x.com', 'c@x.com', 'd@x.com'])
+
+    def test_message_failing_twice_does_not_stop_batch(self):
+        FakeSMTPBackend.disconnects_on = {'b@x.com': 2}
+        self.send()
+
+        self.assertEqual(FakeSMTPBackend.delivered, ['a@x.com', 'c@x.com', 'd@x.com'])
+        stats = self.outbox.stats()
+        self.assertEqual((stats['sent'], stats['failed'], stats['connections']), (3, 2, 3))
+
+
+@test_settings
+class RotateEncKeysTest(TestCase):
+
+    def rotate(self, **options):
+        call_command('rotate_enc_keys', workers=1, chunk_size=2, stdout=io.StringIO(), **options)
+
+    def test_rotates_legacy_ciphers_from_the_start(self):
+        legacy = AES256(settings.SERVER_ENC_KEY)
+        for index in range(3):
+            user = User.objects.create_user_with_profile('john', 'doe', 'M', '2000-01-01', '', f'john{index}@example.com', 'abcd1234')
+            User.objects.filter(pk=user.pk).update(enc_key=legacy.encrypt(f'key{index}'))
+
+        self.rotate()
+
+        # the connection of the test transaction is left open
+        self.assertIsNotNone(connection.connection)
+        keyring = server_cipher()
+        for user in User.objects.all():
+            self.assertFalse(keyring.needs_rotation(user.enc_key))
+            self.assertEqual(keyring.decrypt(user.enc_key), f'key{user.email[4]}')
+
+    def test_empty_table(self):
+        self.rotate()
+
+    def test_invalid_start_pk(self):
+        with self.assertRaises(CommandError):
+            self.rotate(start_pk='not-a-uid')
+
+
+@test_settings
+class ImportUsersTest(TestCase):
+    ROW = {'first_name': 'john', 'last_name': 'doe', 'gender': 'M', 'date_of_birth': '2000-01-01', 'email': 'john@uni.edu', 'password': 'campus2024'}
+
+    def import_rows(self, *rows):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as file:
+            for row in rows:
+                file.write(json.dumps(dict(self.ROW, **row)) + '\n')
+        self.addCleanup(os.unlink, file.name)
+
+        stderr = io.StringIO()
+        call_command('import_users', file.name, workers=1, stdout=io.StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_valid_row(self):
+        self.assertEqual(self.import_rows({}), '')
+        self.assertIsNotNone(connection.connection)
+
+        user = User.objects.get(email='john@uni.edu')
+        self.assertEqual((user.acc_type, user.is_active, user.is_signed), ('STUDENT', True, True))
+        # spawned workers hash with the project hashers, not the ones overridden here
+        with self.settings(PASSWORD_HASHERS=['account.hashers.TunedArgon2PasswordHasher']):
+            self.assertTrue(user.check_password('campus2024'))
+        self.assertTrue(user.username.startswith('john_doe_'))
+        self.assertEqual(len(server_cipher().decrypt(user.enc_key)), 16)
+
+    def test_duplicate_email(self):
+        User.objects.create_user_with_profile('jane', 'doe', 'F', '2000-01-01', '', 'jane@uni.edu', 'abcd1234')
+
+        errors = self.import_rows({}, {'email': 'jane@uni.edu'}, {'first_name': 'johnny'})
+
+        self.assertIn('Email repeated in batch.', errors)
+        self.assertEqual(User.objects.get(email='john@uni.edu').first_name, 'john')
+        self.assertEqual(User.objects.get(email='jane@uni.edu').first_name, 'jane')
+
+    def test_weak_password(self):
+        errors = self.import_rows({'password': 'x'}, {'email': 'common@uni.edu', 'password': 'password1'})
+
+        self.assertIn('Password must be of 8 to 32 character', errors)
+        self.assertIn('too common', errors)
+        self.assertFalse(User.objects.exists())
+
+    def test_bad_name(self):
+        errors = self.import_rows({'first_name': 'jo'}, {'email': 'x@uni.edu', 'last_name': '<script>'})
+
+        self.assertIn('First name must contains atleast 3 characters.', errors)
+        self.assertIn('Last name must contains atleast 2 characters.', errors)
+        self.assertFalse(User.objects.exists())
@@ -12,6 +12,9 @@ class ResentSignupOtpThrottling(AnonRateThrottle):
 class LoginThrottling(AnonRateThrottle):
     scope = 'login'
 
+class LoginRefreshThrottling(AnonRateThrottle):
+    scope = 'login_refresh'
+
 class PasswordRecoveryThrottling(AnonRateThrottle):
     scope = 'password_recovery'
 
@@ -7,6 +7,7 @@ urlpatterns = [
     path('v1/signup/verify/', views.SignupVerification.as_view(), name='signup-verification'),
     path('v1/signup/resent/otp/', views.ResentSignupOtp.as_view(), name='signup-resent-otp'),
     path('v1/login/', views.Login.as_view(), name='login'),
+    path('v1/login/refresh/', views.LoginRefresh.as_view(), name='login-refresh'),
     path('v1/recovery/password/', views.PasswordRecovery.as_view(), name='account-recovery'),
     path('v1/recovery/password/verify/', views.PasswordRecoveryVerification.as_view(), name='account-recovery-verification'),
     path('v1/recovery/password/verify/new/', views.PasswordRecoveryNewPassword.as_view(), name='account-recovery-new-password'),
@@ -4,8 +4,9 @@ from rest_framework.permissions import IsAuthenticated
 from . import serializers
 from .services import SignupService, LoginService, UserService, PasswordRecoveryService, ProfileService
 from .permissions import IsRequestValid, IsAccountCreationKeyValid
-from .throttling import SignupThrottling, SignupVerificationThrottling, ResentSignupOtpThrottling, LoginThrottling, PasswordRecoveryThrottling, PasswordRecoveryVerificationThrottling, PasswordRecoveryNewPasswordThrottling, ResentPasswordRecoveryOtpThrottling, LogoutThrottling, AuthenticatedUserThrottling, ChangeNamesThrottling
+from .throttling import SignupThrottling, SignupVerificationThrottling, ResentSignupOtpThrottling, LoginThrottling, LoginRefreshThrottling, PasswordRecoveryThrottling, PasswordRecoveryVerificationThrottling, PasswordRecoveryNewPasswordThrottling, ResentPasswordRecoveryOtpThrottling, LogoutThrottling, AuthenticatedUserThrottling, ChangeNamesThrottling
 from utils.response import Response
+from utils.hashing import HashingOverloadedError
 from utils.debug import debug_print
 
 
@@ -28,6 +29,8 @@ class Signup(APIView):
 
             # sending error response
             return Response.errors(serializer.errors)
+        except HashingOverloadedError:
+            return Response.overloaded()
         except:
             return Response.something_went_wrong()
 
@@ -71,6 +74,8 @@ class SignupVerification(APIView):
                 return Response.errors(serializer.errors)
             
             return Response.error('Session out! Try again.')
+        except HashingOverloadedError:
+            return Response.overloaded()
         except Exception as e:
             debug_print(e)
             return Response.something_went_wrong()
@@ -97,6 +102,8 @@ class ResentSignupOtp(APIView):
                 return Response.success(response)
             
             return Response.error('Session out! Try again.')
+        except HashingOverloadedError:
+            return Response.overloaded()
         except:
             return Response.something_went_wrong()
 
@@ -116,11 +123,11 @@ class Login(APIView):
 
             if serializer.is_valid():
                 # authenticating user with valid credentials
-                user = LoginService.login(serializer.data)
+                user = LoginService.login(serializer.validated_data)
 
                 if user is not None:
-                    # generating auth tokens
-                    response = LoginService.generate_auth_token(user, request)
+                    # generating auth tokens and updating messaging token
+                    response = LoginService.generate_auth_token(user, request, msg_token=serializer.validated_data.get('msg_token'))
 
                     # sending response
                     return Response.success(response)
@@ -130,6 +137,35 @@ class Login(APIView):
 
             # sending error reponse
             return Response.errors(serializer.errors)
+        except HashingOverloadedError:
+            return Response.overloaded()
+        except:
+            return Response.something_went_wrong()
+
+
+
+
+
+# Login Refresh
+class LoginRefresh(APIView):
+    parser_classes = [JSONParser]
+    permission_classes = [IsRequestValid]
+    throttle_classes = [LoginRefreshThrottling]
+
+    def post(self, request):
+        try:
+            is_verified, sid = LoginService.verify_refresh_token(request)
+
+            # validating token
+            if is_verified:
+                # generating new access token
+                response = LoginService.refresh_auth_token(sid, request)
+
+                if response is not None:
+                    # sending response
+                    return Response.success(response)
+
+            return Response.error('Session out! Try again.')
         except:
             return Response.something_went_wrong()
 
@@ -155,6 +191,8 @@ class PasswordRecovery(APIView):
 
             # sending error response
             return Response.errors(serializer.errors)
+        except HashingOverloadedError:
+            return Response.overloaded()
         except:
             return Response.something_went_wrong()
 
@@ -192,6 +230,8 @@ class PasswordRecoveryVerification(APIView):
                 return Response.errors(serializer.errors)
             
             return Response.error('Session out! Try again.')
+        except HashingOverloadedError:
+            return Response.overloaded()
         except:
             return Response.something_went_wrong()
 
@@ -230,6 +270,8 @@ class PasswordRecoveryNewPassword(APIView):
                 return Response.errors(serializer.errors)
             
             return Response.error('Session out! Try again.') 
+        except HashingOverloadedError:
+            return Response.overloaded()
         except:
            return Response.something_went_wrong()
 
@@ -255,6 +297,8 @@ class ResentPasswordRecoveryOtp(APIView):
                 return Response.success(response)
             
             return Response.error('Session out! Try again.')
+        except HashingOverloadedError:
+            return Response.overloaded()
         except:
             return Response.something_went_wrong()
 
@@ -283,6 +327,8 @@ class ChangePassword(APIView):
                 })
 
             return Response.errors(serializer.errors)
+        except HashingOverloadedError:
+            return Response.overloaded()
         except:
             return Response.something_went_wrong()
 
@@ -313,6 +359,8 @@ class ChangeUserNames(APIView):
                 })
 
             return Response.errors(serializer.errors)
+        except HashingOverloadedError:
+            return Response.overloaded()
         except Exception as e:
             debug_print(e)
             return Response.something_went_wrong()
@@ -1,4 +1,6 @@
+import os
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 
 # Loads environment variables
@@ -77,6 +79,34 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Shared by every worker process, signup and recovery flow states and throttle counters live here.
+# Set CACHE_BACKEND and CACHE_LOCATION in the environment, e.g. django.core.cache.backends.redis.RedisCache
+# and redis://127.0.0.1:6379. Without them a local memory cache of this process is used, which only suits a
+# single development server, so it is refused when DEBUG is off.
+# CACHE_MAX_ENTRIES bounds the local memory backend only, a third of the entries is culled once it is reached.
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND')
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', '')
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 10000))
+
+if CACHE_BACKEND is None:
+    if not DEBUG:
+        raise ImproperlyConfigured('CACHE_BACKEND must be set when DEBUG is off, every worker process shares the cache.')
+    CACHE_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    }
+}
+
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': CACHE_MAX_ENTRIES}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -95,6 +125,22 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashers, new passwords use the first one and passwords of the others are upgraded on login
+# https://docs.djangoproject.com/en/4.2/topics/auth/passwords/
+
+PASSWORD_HASHERS = [
+    'account.hashers.TunedArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Argon2 costs, memory in KiB, suggested for this host by tune_password_hasher
+ARGON2_TIME_COST = 2
+ARGON2_MEMORY_COST = 64 * 1024 # 64 MiB
+ARGON2_PARALLELISM = 2
+
 
 # Rest API Framework configurations
 REST_FRAMEWORK = {
@@ -109,6 +155,7 @@ REST_FRAMEWORK = {
         'signup_verification': '100/min',
         'resent_signup_otp': '10/min',
         'login': '10/min',
+        'login_refresh': '30/min',
         'password_recovery': '10/min',
         'password_recovery_verification': '100/min',
         'password_recovery_new_password': '10/min',
@@ -122,6 +169,7 @@ REST_FRAMEWORK = {
 
 # Jwt Config
 JWT_SECRET = 'django-insecure-1c!e2361=wha=2pt^b0ss$^8@@8u-k6*7ds=c7o73b64wi7#!w'
+JWT_VERIFIED_CACHE_SIZE = 1024 # recently verified tokens kept decoded, 0 disables
 
 # Softauth api key
 SOFTAUTH_API_KEY = 'django-insecure-1c!e2361=wha=2pt^b0ss$^8@@8u-k6*7ds=c7o73b64wi7#!w'
@@ -132,6 +180,24 @@ ACCOUNT_CREATION_KEY = 'django-insecure-1c!e2361=wha=2pt^b0ss$^8@@8u-k6*7ds=c7o7
 # Encryption Key
 SERVER_ENC_KEY = 'django-insecure-1c!e2361=wha=2pt^b0ss$^8@@8u-k6*7ds=c7o73b64wi7#!w'
 
+# Encryption keyring, key id to key, key ids are embedded in ciphers.
+# New ciphers use SERVER_ENC_KEY_ID, to rotate add a key, point SERVER_ENC_KEY_ID at it and
+# run rotate_enc_keys. SERVER_ENC_KEY keeps decrypting ciphers written before key ids.
+SERVER_ENC_KEY_ID = 'k1'
+SERVER_ENC_KEYS = {
+    'k1': SERVER_ENC_KEY,
+}
+
+# Password and OTP hashing executor, hashes run on at most HASHING_MAX_WORKERS threads with
+# HASHING_MAX_QUEUE more waiting, requests beyond that are rejected with 429 instead of queuing.
+HASHING_MAX_WORKERS = 4
+HASHING_MAX_QUEUE = 16
+HASHING_TIMEOUT_SECONDS = 5
+
+# OTP digest hasher, utils.otp.BcryptOTPHasher keeps the slow bcrypt digests.
+# OTPs hashed by either hasher verify after switching.
+OTP_HASHER = 'utils.otp.HMACOTPHasher'
+
 # Token expire time
 SIGNUP_EXPIRE_SECONDS = 10 * 60 # 10 minute
 PASSWORD_RECOVERY_EXPIRE_SECONDS = 10 * 60 # 10 minute
@@ -140,6 +206,69 @@ OTP_EXPIRE_SECONDS = 3 * 60 # 3 minute
 RESENT_OTP_EXPIRE_SECONDS = 5 * 60 # 5 minute
 PASSWORD_EXPIRE_SECONDS = 5 * 60 # 5 minute
 AUTH_EXPIRE_SECONDS = 30 * 24 * 60 * 60 # 30 days
+AUTH_ACCESS_EXPIRE_SECONDS = 5 * 60 # 5 minute
+
+# Maximum login sessions kept per user, older sessions are logged out on login
+MAX_LOGIN_SESSIONS = 5
+
+# Expired login state sweeper, deletes in primary key ranges of batch size.
+# In-process sweep runs every LOGIN_STATE_SWEEP_SECONDS, None disables it.
+LOGIN_STATE_SWEEP_BATCH_SIZE = 5000
+LOGIN_STATE_SWEEP_MAX_BATCHES = 20
+LOGIN_STATE_SWEEP_SECONDS = None
+
+# Two token mode
+# login issues a short lived access token (LA) verified from its signature and claims only,
+# with a login state backed refresh token (LR) exchanged at the login refresh endpoint.
+AUTH_TWO_TOKEN_MODE = False
+
+# Revoked access token filter, sized for revocations within one access token lifetime
+REVOCATION_FILTER_CAPACITY = 100000
+REVOCATION_FILTER_ERROR_RATE = 0.001
+REVOCATION_REFRESH_SECONDS = 5
+
+# Registered email filter, signup, login and recovery skip the database for emails it rules out.
+# Users created by other workers are added within EMAIL_FILTER_REFRESH_SECONDS, until then their
+# emails are marked in the cache. The filter is rebuilt from every user each EMAIL_FILTER_REBUILD_SECONDS.
+EMAIL_FILTER_CAPACITY = 1000000
+EMAIL_FILTER_ERROR_RATE = 0.001
+EMAIL_FILTER_REFRESH_SECONDS = 5
+EMAIL_FILTER_REBUILD_SECONDS = 15 * 60 # 15 minute
+
+# Authenticated principal cache
+# entries live until login state active_until, capped by timeout. Logout and password changes only
+# invalidate the worker serving them, so the timeout bounds how long other workers accept a logged out session.
+PRINCIPAL_CACHE_SIZE = 10000
+PRINCIPAL_CACHE_TIMEOUT = 3 # 3 seconds
+
+# Decrypted user encryption key cache, kept in process memory only
+ENC_KEY_CACHE_SIZE = 10000
+ENC_KEY_CACHE_TIMEOUT = 10 * 60 # 10 minute
+
+# Email outbox, utils.outbox.outbox queues emails in process memory and sends them in batches by
+# sender threads keeping their SMTP connection open, idle connections are closed after EMAIL_OUTBOX_IDLE_SECONDS.
+# account.outbox.database_outbox stores emails in the EmailOutbox table to be sent by dispatch_emails,
+# claims are leased for EMAIL_OUTBOX_LEASE_SECONDS and failures retried after EMAIL_OUTBOX_RETRY_SECONDS doubling per attempt.
+EMAIL_OUTBOX = 'utils.outbox.outbox'
+EMAIL_OUTBOX_WORKERS = 2
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_QUEUE = 10000
+EMAIL_OUTBOX_IDLE_SECONDS = 30
+EMAIL_OUTBOX_LEASE_SECONDS = 60
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_SECONDS = 30
+
+# User profile cache, in-process L1 entries are rechecked after PROFILE_CACHE_L1_TIMEOUT
+# in front of the shared cache holding them for PROFILE_CACHE_TIMEOUT
+PROFILE_CACHE_SIZE = 10000
+PROFILE_CACHE_L1_TIMEOUT = 5 # 5 seconds
+PROFILE_CACHE_TIMEOUT = 10 * 60 # 10 minute
+
+# Signup and password recovery flow states are cached as compact bytes, zlib compressed when smaller
+FLOW_STATE_COMPRESSION = True
+
+# User agent parse cache, number of distinct user agent headers kept parsed
+USER_AGENT_CACHE_SIZE = 4096
 
 
 # Internationalization
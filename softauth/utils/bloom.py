@@ -0,0 +1,41 @@
+import math
+import hashlib
+
+
+class BloomFilter:
+    '''Compact probabilistic set, membership tests have no false negatives and about error_rate false positives'''
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(1, capacity)
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self.__bits = bytearray((self.size + 7) // 8)
+
+    # returns bit positions of item using double hashing of one blake2b digest
+    def __positions(self, item):
+        digest = hashlib.blake2b(str(item).encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    # adds item to the filter
+    def add(self, item):
+        for position in self.__positions(item):
+            self.__bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    # adds all the items to the filter
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        bits = self.__bits
+        for position in self.__positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,118 @@
+import threading
+import time
+from django.core.cache import caches
+from .lru import LRUCache
+
+
+MISSING = object()
+
+
+class TieredCache:
+    '''Namespaced cache with an in-process LRU (L1) in front of a shared Django cache (L2).
+    Keys carry the namespace generation stored in L2, bumping it invalidates the namespace for every worker.
+    L1 entries and the generation are rechecked after l1_timeout, which bounds staleness across workers.'''
+
+    def __init__(self, namespace, alias='default', l1_size=1024, l1_timeout=5, timeout=300):
+        self.namespace = namespace
+        self.alias = alias
+        self.l1_timeout = l1_timeout
+        self.timeout = timeout
+        self.__l1 = LRUCache(maxsize=l1_size, timeout=l1_timeout)
+        self.__generation = None
+        self.__generation_checked_on = 0.0
+        self.__lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    # returns current namespace generation, read from L2 at most once per l1_timeout
+    def generation(self):
+        now = time.monotonic()
+        if self.__generation is not None and now - self.__generation_checked_on < self.l1_timeout:
+            return self.__generation
+
+        generation_key = f'{self.namespace}:generation'
+        generation = self.backend.get(generation_key)
+        if generation is None:
+            self.backend.add(generation_key, 1, timeout=None)
+            generation = self.backend.get(generation_key, 1)
+
+        with self.__lock:
+            # entries of an older generation must not be served from L1
+            if generation != self.__generation:
+                self.__l1.clear()
+            self.__generation = generation
+            self.__generation_checked_on = now
+
+        return generation
+
+    def __key(self, key, generation):
+        return f'{self.namespace}:{generation}:{key}'
+
+    def get(self, key, default=None):
+        generation = self.generation()
+
+        value = self.__l1.get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        value = self.backend.get(self.__key(key, generation), MISSING)
+        if value is MISSING:
+            return default
+
+        self.__l1.set(key, value)
+        return value
+
+    # returns dict of found keys, fetching L1 misses from L2 in one call
+    def get_many(self, keys):
+        generation = self.generation()
+        found, missing = {}, {}
+
+        for key in keys:
+            value = self.__l1.get(key, MISSING)
+            if value is MISSING:
+                missing[self.__key(key, generation)] = key
+            else:
+                found[key] = value
+
+        if missing:
+            for cache_key, value in self.backend.get_many(list(missing)).items():
+                key = missing[cache_key]
+                found[key] = value
+                self.__l1.set(key, value)
+
+        return found
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(self.__key(key, self.generation()), value, timeout=timeout or self.timeout)
+        self.__l1.set(key, value)
+
+    def set_many(self, mapping, timeout=None):
+        generation = self.generation()
+        self.backend.set_many({self.__key(key, generation): value for key, value in mapping.items()}, timeout=timeout or self.timeout)
+        for key, value in mapping.items():
+            self.__l1.set(key, value)
+
+    # removes key from L2 and this worker's L1, other workers drop it within l1_timeout
+    def delete(self, key):
+        self.backend.delete(self.__key(key, self.generation()))
+        self.__l1.delete(key)
+
+    # invalidates every key of the namespace by moving to a new generation
+    def invalidate(self):
+        generation_key = f'{self.namespace}:generation'
+        try:
+            generation = self.backend.incr(generation_key)
+        except ValueError:
+            self.backend.add(generation_key, 1, timeout=None)
+            generation = self.backend.incr(generation_key)
+
+        with self.__lock:
+            self.__l1.clear()
+            self.__generation = generation
+            self.__generation_checked_on = time.monotonic()
+
+    # returns L1 counters and current generation
+    def stats(self):
+        return dict(self.__l1.stats(), generation=self.__generation)
@@ -0,0 +1,88 @@
+import zlib
+
+
+class FlowStateCodec:
+    '''Compact binary encoding of a flow state dict with a fixed field layout.
+    Layout is version byte | flags byte | per field varint(length + 1) and utf-8 bytes, length 0 meaning None,
+    the part after the flags byte is zlib compressed when that makes it smaller.'''
+
+    VERSION = 1
+    COMPRESSED = 0x01
+
+    def __init__(self, fields, compress=True, compress_min_size=64):
+        self.fields = tuple(fields)
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+
+    # returns encoded bytes of data, fields outside the layout are not kept
+    def encode(self, data):
+        body = bytearray()
+        for field in self.fields:
+            value = data.get(field)
+            if value is None:
+                body.append(0)
+                continue
+
+            raw = str(value).encode('utf-8')
+            self.__write_varint(body, len(raw) + 1)
+            body += raw
+
+        flags = 0
+        body = bytes(body)
+        if self.compress and len(body) >= self.compress_min_size:
+            compressed = zlib.compress(body, 9)
+            if len(compressed) < len(body):
+                flags, body = self.COMPRESSED, compressed
+
+        return bytes((self.VERSION, flags)) + body
+
+    # returns data dict of encoded bytes, dicts cached before the encoding are returned as they are
+    # raises ValueError if blob is malformed or of an unknown version
+    def decode(self, blob):
+        if blob is None or isinstance(blob, dict):
+            return blob
+
+        if len(blob) < 2 or blob[0] != self.VERSION:
+            raise ValueError('Unknown flow state version.')
+
+        body = blob[2:]
+        if blob[1] & self.COMPRESSED:
+            try:
+                body = zlib.decompress(body)
+            except zlib.error:
+                raise ValueError('Invalid flow state.')
+
+        data, offset = {}, 0
+        for field in self.fields:
+            length, offset = self.__read_varint(body, offset)
+            if length == 0:
+                data[field] = None
+                continue
+
+            end = offset + length - 1
+            if end > len(body):
+                raise ValueError('Invalid flow state.')
+            data[field] = body[offset:end].decode('utf-8')
+            offset = end
+
+        return data
+
+    @staticmethod
+    def __write_varint(buffer, value):
+        while value >= 0x80:
+            buffer.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buffer.append(value)
+
+    @staticmethod
+    def __read_varint(buffer, offset):
+        value = shift = 0
+        while True:
+            if offset >= len(buffer):
+                raise ValueError('Invalid flow state.')
+            byte = buffer[offset]
+            offset += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, offset
+            shift += 7
@@ -14,11 +14,11 @@ def generate_uuid():
 def generate_identity():
     return str(uuid.uuid4())
 
-# returns generated username
-def generate_username(first_name, last_name):
+# returns username base of names, usernames are base + '_' + numeric suffix
+def generate_username_base(first_name, last_name):
     if first_name != '' and last_name != '':
-        return first_name.lower() + '_' + last_name.lower() + '_' + str(random.randint(1000, 9999))
-    return first_name.lower() + '_' + str(random.randint(1000, 9999))
+        return first_name.lower() + '_' + last_name.lower()
+    return first_name.lower()
 
 # returns generated random token
 def generate_token():
@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class HashingOverloadedError(Exception):
+    def __init__(self, message='Too many requests. Please try again after some time.'):
+        self.message = message
+        super().__init__(self.message)
+
+
+class HashingExecutor:
+    '''Bounded thread pool running password and OTP hashing off the request threads.
+    At most max_workers hashes run at once and max_queue more wait, any call beyond that is rejected at once.'''
+
+    def __init__(self, max_workers, max_queue, timeout):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.__pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hashing')
+        self.__slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self.__lock = threading.Lock()
+        self.__in_flight = 0
+        self.__completed = 0
+        self.__rejected = 0
+        self.__timed_out = 0
+        self.__wait_total = 0.0
+        self.__wait_max = 0.0
+        self.__hash_total = 0.0
+        self.__hash_max = 0.0
+
+    # returns result of function run on the pool, raises HashingOverloadedError if the queue is full or the wait times out
+    # function must not touch the database, its thread is not managed by the request cycle
+    def run(self, function, *args, **kwargs):
+        if not self.__slots.acquire(blocking=False):
+            with self.__lock:
+                self.__rejected += 1
+            raise HashingOverloadedError()
+
+        with self.__lock:
+            self.__in_flight += 1
+
+        try:
+            future = self.__pool.submit(self.__measure, time.perf_counter(), function, args, kwargs)
+        except BaseException:
+            self.__release()
+            raise
+        future.add_done_callback(lambda _: self.__release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            with self.__lock:
+                self.__timed_out += 1
+            raise HashingOverloadedError()
+
+    def __measure(self, queued_on, function, args, kwargs):
+        started_on = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            wait, elapsed = started_on - queued_on, time.perf_counter() - started_on
+            with self.__lock:
+                self.__completed += 1
+                self.__wait_total += wait
+                self.__wait_max = max(self.__wait_max, wait)
+                self.__hash_total += elapsed
+                self.__hash_max = max(self.__hash_max, elapsed)
+
+    def __release(self):
+        with self.__lock:
+            self.__in_flight -= 1
+        self.__slots.release()
+
+    # returns executor counters, times in milliseconds
+    def stats(self):
+        with self.__lock:
+            completed = max(self.__completed, 1)
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'in_flight': self.__in_flight,
+                'queued': max(self.__in_flight - self.max_workers, 0),
+                'completed': self.__completed,
+                'rejected': self.__rejected,
+                'timed_out': self.__timed_out,
+                'wait_avg_ms': self.__wait_total / completed * 1000,
+                'wait_max_ms': self.__wait_max * 1000,
+                'hash_avg_ms': self.__hash_total / completed * 1000,
+                'hash_max_ms': self.__hash_max * 1000,
+            }
+
+
+executor = HashingExecutor(
+    max_workers=settings.HASHING_MAX_WORKERS,
+    max_queue=settings.HASHING_MAX_QUEUE,
+    timeout=settings.HASHING_TIMEOUT_SECONDS,
+)
+
+
+# returns (is valid, needs rehash) of raw password against encoded password
+# rehash is needed when the password was hashed by another hasher or with other costs than the preferred one
+def _verify_password(password, encoded):
+    if not encoded or not hashers.is_password_usable(encoded):
+        return (False, False)
+
+    is_valid = hashers.check_password(password, encoded)
+    if not is_valid:
+        return (False, False)
+
+    preferred = hashers.get_hasher('default')
+    return (True, hashers.identify_hasher(encoded).algorithm != preferred.algorithm or preferred.must_update(encoded))
+
+# returns (is valid, needs rehash) of password, saving a rehashed password is left to the caller's thread
+def verify_password(password, encoded):
+    return executor.run(_verify_password, password, encoded)
+
+# returns encoded password of raw password
+def make_password(password):
+    return executor.run(hashers.make_password, password)
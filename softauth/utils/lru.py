@@ -0,0 +1,71 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    '''Bounded, thread safe in-process LRU cache with optional per entry timeout and hit/miss counters'''
+
+    def __init__(self, maxsize=1024, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.__data = OrderedDict()
+        self.__lock = threading.Lock()
+
+    # returns cached value of key or default if key is missing or expired
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__data.get(key)
+
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.__data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.__data[key]
+
+            self.misses += 1
+            return default
+
+    # stores value for key, timeout in seconds overrides the cache timeout
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        expires_at = None if timeout is None else time.monotonic() + timeout
+
+        if self.maxsize <= 0 or (timeout is not None and timeout <= 0):
+            return
+
+        with self.__lock:
+            self.__data[key] = (value, expires_at)
+            self.__data.move_to_end(key)
+
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+
+    # removes key from cache
+    def delete(self, key):
+        with self.__lock:
+            self.__data.pop(key, None)
+
+    # removes all the keys from cache
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+
+    # returns cache counters
+    def stats(self):
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.__data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self.__data)
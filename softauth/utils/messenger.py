@@ -1,11 +1,12 @@
 from django.conf import settings
 from django.core.mail import EmailMessage
+from django.utils.module_loading import import_string
 from .debug import debug_print
 
 class Mailer:
     @staticmethod
     def sendEmail(email, data):
-        '''sends email'''
+        '''queues email on the outbox named by EMAIL_OUTBOX'''
 
         if settings.DEBUG:
             # printing data only for Development
@@ -20,7 +21,6 @@ class Mailer:
                     to=[email,], 
                     reply_to=['support@example.com']
                 )
-                email.send(fail_silently=False)
+                import_string(settings.EMAIL_OUTBOX).put(email)
             except Exception as e:
                 debug_print(e)
-            
\ No newline at end of file
@@ -1,15 +1,75 @@
-import random
+import hmac
+import hashlib
+import secrets
+import functools
 import bcrypt
+from django.conf import settings
+from django.utils.module_loading import import_string
+from . import hashing
+
+
+class HMACOTPHasher:
+    '''Keyed HMAC-SHA256 OTP digest "hmac$<nonce>$<digest>", a random nonce keeps equal OTPs apart'''
+
+    algorithm = 'hmac'
+
+    def __init__(self):
+        self.__mac = hmac.new(hashlib.sha256(b'softauth otp' + settings.SECRET_KEY.encode('utf-8')).digest(), digestmod=hashlib.sha256)
+
+    def __digest(self, nonce, OTP):
+        mac = self.__mac.copy()
+        mac.update(nonce.encode('ascii') + b'$' + OTP.encode('utf-8'))
+        return mac.hexdigest()
+
+    def encode(self, OTP):
+        nonce = secrets.token_hex(8)
+        return f'{self.algorithm}${nonce}${self.__digest(nonce, OTP)}'
+
+    def verify(self, OTP, hashOTP):
+        _, nonce, digest = hashOTP.split('$', 2)
+        return hmac.compare_digest(self.__digest(nonce, OTP), digest)
+
+
+class BcryptOTPHasher:
+    '''bcrypt OTP digest, the format OTPs were hashed with before hashers were pluggable, hashed on the hashing executor'''
+
+    algorithm = 'bcrypt'
+    rounds = 10
+
+    def encode(self, OTP):
+        return hashing.executor.run(bcrypt.hashpw, OTP.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def verify(self, OTP, hashOTP):
+        return hashing.executor.run(bcrypt.checkpw, OTP.encode('utf-8'), hashOTP.encode('utf-8'))
+
+
+# returns hasher new OTPs are hashed with
+@functools.lru_cache(maxsize=None)
+def get_hasher():
+    return import_string(settings.OTP_HASHER)()
+
+# returns hasher of algorithm, configured hasher is shared for its own algorithm
+@functools.lru_cache(maxsize=None)
+def _hasher_of(algorithm):
+    hasher = get_hasher()
+    if hasher.algorithm == algorithm:
+        return hasher
+    return {HMACOTPHasher.algorithm: HMACOTPHasher, BcryptOTPHasher.algorithm: BcryptOTPHasher}[algorithm]()
+
+# returns hasher of hashed OTP, detected from its format so OTPs issued before a hasher switch still verify
+def identify_hasher(hashOTP):
+    # bcrypt digests start with "$2b$" and carry no algorithm prefix
+    algorithm = hashOTP.partition('$')[0] or BcryptOTPHasher.algorithm
+    return _hasher_of(algorithm)
 
 # returns generated 6 digit OTP
 def generate():
-    OTP = str(random.random())[3:9]
-    salt = bcrypt.gensalt(10)
-    hashOTP = bcrypt.hashpw(OTP.encode('utf-8'), salt)
-    return OTP, hashOTP.decode('utf-8')
+    OTP = f'{secrets.randbelow(10 ** 6):06d}'
+    return OTP, get_hasher().encode(OTP)
 
 # check whether the OTP is valid or not
 def compare(OTP, hashOTP):
-    if bcrypt.checkpw(OTP.encode('utf-8'), hashOTP.encode('utf-8')):
-        return True
-    return False
\ No newline at end of file
+    try:
+        return identify_hasher(hashOTP).verify(OTP, hashOTP)
+    except (ValueError, TypeError, AttributeError, KeyError):
+        return False
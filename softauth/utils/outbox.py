@@ -0,0 +1,152 @@
+import queue
+import smtplib
+import threading
+import time
+from django.conf import settings
+from django.core.mail import get_connection
+from .debug import debug_print
+
+
+class EmailOutbox:
+    '''In-process email queue drained in batches by sender threads, each keeping its SMTP connection open between batches'''
+
+    def __init__(self, workers, batch_size, max_queue, idle_timeout):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.__queue = queue.Queue(maxsize=max_queue)
+        self.__threads = []
+        self.__lock = threading.Lock()
+        self.__enqueued = 0
+        self.__dropped = 0
+        self.__sent = 0
+        self.__failed = 0
+        self.__batches = 0
+        self.__connections = 0
+        self.__send_total = 0.0
+
+    # queues email message and returns at once, returns False if the outbox is full
+    def put(self, message):
+        self.start()
+
+        try:
+            self.__queue.put_nowait(message)
+        except queue.Full:
+            with self.__lock:
+                self.__dropped += 1
+            debug_print(f'email outbox full, dropped email to {message.to}')
+            return False
+
+        with self.__lock:
+            self.__enqueued += 1
+        return True
+
+    # starts sender threads once, calling it again is a no-op
+    def start(self):
+        if self.__threads:
+            return
+
+        with self.__lock:
+            if self.__threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self.__run, name=f'email-outbox-{index}', daemon=True)
+                thread.start()
+                self.__threads.append(thread)
+
+    # blocks until every queued email was sent or failed
+    def flush(self):
+        self.__queue.join()
+
+    def __run(self):
+        connection = None
+
+        while True:
+            try:
+                batch = [self.__queue.get(timeout=self.idle_timeout)]
+            except queue.Empty:
+                # closing connection left idle so the SMTP server does not drop it half way through a batch
+                connection = self.__close(connection)
+                continue
+
+            # taking whatever else is already queued, up to batch size
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                connection = self.__send(connection, batch)
+            finally:
+                for _ in batch:
+                    self.__queue.task_done()
+
+    # sends each message of batch over connection, a message failing on a kept open connection that went stale
+    # is retried once on a new connection, so no message is sent twice and a failure never stops the rest of the batch
+    def __send(self, connection, batch):
+        start = time.perf_counter()
+        sent = failed = 0
+
+        for message in batch:
+            for attempt in range(2):
+                try:
+                    if connection is None:
+                        connection = get_connection(fail_silently=False)
+                        connection.open()
+                        with self.__lock:
+                            self.__connections += 1
+
+                    if connection.send_messages([message]):
+                        sent += 1
+                    else:
+                        failed += 1
+                    break
+                except smtplib.SMTPRecipientsRefused as e:
+                    # rejected by the server, the connection is still usable and a retry would be rejected again
+                    debug_print(e)
+                    failed += 1
+                    break
+                except Exception as e:
+                    debug_print(e)
+                    connection = self.__close(connection)
+            else:
+                failed += 1
+
+        with self.__lock:
+            self.__sent += sent
+            self.__failed += failed
+            self.__batches += 1
+            self.__send_total += time.perf_counter() - start
+        return connection
+
+    @staticmethod
+    def __close(connection):
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception as e:
+                debug_print(e)
+        return None
+
+    # returns delivery counters
+    def stats(self):
+        with self.__lock:
+            return {
+                'queued': self.__queue.qsize(),
+                'enqueued': self.__enqueued,
+                'dropped': self.__dropped,
+                'sent': self.__sent,
+                'failed': self.__failed,
+                'batches': self.__batches,
+                'connections': self.__connections,
+                'batch_avg_ms': self.__send_total / max(self.__batches, 1) * 1000,
+            }
+
+
+outbox = EmailOutbox(
+    workers=settings.EMAIL_OUTBOX_WORKERS,
+    batch_size=settings.EMAIL_OUTBOX_BATCH_SIZE,
+    max_queue=settings.EMAIL_OUTBOX_MAX_QUEUE,
+    idle_timeout=settings.EMAIL_OUTBOX_IDLE_SECONDS,
+)
@@ -0,0 +1,41 @@
+import threading
+from django.db import close_old_connections
+from .debug import debug_print
+
+
+class PeriodicTask:
+    '''Runs function every interval seconds on a daemon thread of the current process'''
+
+    def __init__(self, interval, function, name=None):
+        self.interval = interval
+        self.function = function
+        self.name = name or getattr(function, '__name__', 'periodic-task')
+        self.__thread = None
+        self.__stopped = threading.Event()
+        self.__lock = threading.Lock()
+
+    # starts the task thread once, calling it again is a no-op
+    def start(self):
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.__thread = threading.Thread(target=self.__run, name=self.name, daemon=True)
+            self.__thread.start()
+
+    # stops the task thread after the running call completes
+    def stop(self):
+        self.__stopped.set()
+
+    @property
+    def is_running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def __run(self):
+        while not self.__stopped.wait(self.interval):
+            try:
+                self.function()
+            except Exception as e:
+                debug_print(e)
+            finally:
+                # task thread holds its own database connection
+                close_old_connections()
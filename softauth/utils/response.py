@@ -54,6 +54,15 @@ class Response:
         response['errors'] = errors
         return Resp(response, status=200)
     
+    # overloaded response, sent when the request is shed instead of queued
+    @staticmethod
+    def overloaded(error = "Too many requests. Please try again after some time."):
+        response = get_default_response_json()
+        response['errors'] = {
+            "server": [error]
+        }
+        return Resp(response, status=429)
+
     # something went wrong response
     @staticmethod
     def something_went_wrong():
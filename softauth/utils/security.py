@@ -1,4 +1,13 @@
+import base64
+import functools
+import hashlib
+import hmac
+from django.conf import settings
 from AesEverywhere import aes256
+from Cryptodome.Cipher import ChaCha20
+from Cryptodome.Hash import SHA256
+from Cryptodome.Protocol.KDF import HKDF
+from Cryptodome.Random import get_random_bytes
 
 class AES256:
     def __init__(self, key):
@@ -10,4 +19,176 @@ class AES256:
 
     def decrypt(self, cipher):
         raw = aes256.decrypt(cipher.encode('utf-8'), self.key)
-        return raw.decode('utf-8')
\ No newline at end of file
+        return raw.decode('utf-8')
+
+
+class AEAD:
+    '''ChaCha20 encryption with a truncated HMAC-SHA256 tag over it (encrypt-then-MAC), both keys derived once from secret and context.
+    A blob is nonce | block counter | ciphertext | tag, blobs encrypted together share a nonce at distinct keystream blocks.'''
+
+    NONCE_SIZE = 12
+    COUNTER_SIZE = 4
+    TAG_SIZE = 16
+    BLOCK_SIZE = 64
+    MAX_COUNTER = 2 ** 32 - 1
+
+    def __init__(self, secret, context):
+        keys = HKDF(secret.encode('utf-8'), 64, b'', SHA256, context=context)
+        self.__key = keys[:32]
+        # keyed HMAC state is copied per tag instead of hashing the key again
+        self.__mac = hmac.new(keys[32:], digestmod=hashlib.sha256)
+
+    # returns tag of header and ciphertext, associated data is authenticated with its bit length appended
+    def __tag(self, associated_data, header, ciphertext):
+        mac = self.__mac.copy()
+        mac.update(associated_data)
+        mac.update(header)
+        mac.update(ciphertext)
+        mac.update((len(associated_data) * 8).to_bytes(8, 'big'))
+        return mac.digest()[:self.TAG_SIZE]
+
+    # returns blob of raw bytes, associated data is authenticated but not stored
+    def encrypt(self, raw: bytes, associated_data=b''):
+        nonce = get_random_bytes(self.NONCE_SIZE)
+        header = nonce + bytes(self.COUNTER_SIZE)
+        ciphertext = ChaCha20.new(key=self.__key, nonce=nonce).encrypt(raw)
+        return header + ciphertext + self.__tag(associated_data, header, ciphertext)
+
+    # returns blobs of raws, encrypted with one ChaCha20 instance at consecutive keystream blocks
+    def encrypt_many(self, raws, associated_data=b''):
+        blobs, cipher, counter = [], None, 0
+
+        for raw in raws:
+            blocks = (len(raw) + self.BLOCK_SIZE - 1) // self.BLOCK_SIZE
+            if cipher is None or counter + blocks > self.MAX_COUNTER:
+                nonce = get_random_bytes(self.NONCE_SIZE)
+                cipher, counter = ChaCha20.new(key=self.__key, nonce=nonce), 0
+
+            cipher.seek(counter * self.BLOCK_SIZE)
+            header = nonce + counter.to_bytes(self.COUNTER_SIZE, 'big')
+            ciphertext = cipher.encrypt(raw)
+            blobs.append(header + ciphertext + self.__tag(associated_data, header, ciphertext))
+            counter += blocks
+
+        return blobs
+
+    # returns header, ciphertext and keystream position of blob, raises ValueError if blob is malformed or was tampered with
+    def __open(self, blob, associated_data):
+        header_size = self.NONCE_SIZE + self.COUNTER_SIZE
+        if len(blob) < header_size + self.TAG_SIZE:
+            raise ValueError('Invalid ciphertext.')
+
+        header, ciphertext, tag = blob[:header_size], blob[header_size:-self.TAG_SIZE], blob[-self.TAG_SIZE:]
+        if not hmac.compare_digest(tag, self.__tag(associated_data, header, ciphertext)):
+            raise ValueError('MAC check failed')
+
+        return header[:self.NONCE_SIZE], ciphertext, int.from_bytes(header[self.NONCE_SIZE:], 'big') * self.BLOCK_SIZE
+
+    # returns raw bytes, raises ValueError if blob is malformed or was tampered with
+    def decrypt(self, blob: bytes, associated_data=b''):
+        nonce, ciphertext, position = self.__open(blob, associated_data)
+        cipher = ChaCha20.new(key=self.__key, nonce=nonce)
+        if position:
+            cipher.seek(position)
+        return cipher.decrypt(ciphertext)
+
+    # returns raw bytes of blobs, reusing one ChaCha20 instance for blobs encrypted together
+    def decrypt_many(self, blobs, associated_data=b''):
+        raws, cipher, cipher_nonce = [], None, None
+
+        for blob in blobs:
+            nonce, ciphertext, position = self.__open(blob, associated_data)
+            if nonce != cipher_nonce:
+                cipher, cipher_nonce = ChaCha20.new(key=self.__key, nonce=nonce), nonce
+
+            cipher.seek(position)
+            raws.append(cipher.decrypt(ciphertext))
+
+        return raws
+
+
+class Keyring:
+    '''AEAD ciphers by key id, encrypts with the current key and decrypts ciphers of every key in the ring.
+    Ciphers are "v1.<key id>." + base64url(AEAD blob) with the prefix authenticated, so a cipher can not be moved
+    to another key id. Ciphers without key id are AES-Everywhere ciphers of the legacy key written by AES256.'''
+
+    VERSION = 'v1.'
+    CONTEXT = b'softauth keyring v1'
+
+    def __init__(self, keys, current_id, legacy_key):
+        if current_id not in keys:
+            raise ValueError(f'Unknown current key id {current_id!r}.')
+
+        for key_id in keys:
+            if not key_id or '.' in key_id:
+                raise ValueError(f'Invalid key id {key_id!r}.')
+
+        self.current_id = current_id
+        self.__ciphers = {key_id: AEAD(key, context=self.CONTEXT) for key_id, key in keys.items()}
+        self.__legacy = AES256(legacy_key)
+
+    # returns key id embedded in cipher, None for ciphers of the legacy key
+    def key_id(self, cipher):
+        if not cipher.startswith(self.VERSION):
+            return None
+        return cipher[len(self.VERSION):].partition('.')[0]
+
+    # returns True if cipher is not encrypted with the current key
+    def needs_rotation(self, cipher):
+        return self.key_id(cipher) != self.current_id
+
+    def encrypt(self, raw):
+        prefix = f'{self.VERSION}{self.current_id}.'
+        blob = self.__ciphers[self.current_id].encrypt(raw.encode('utf-8'), associated_data=prefix.encode('ascii'))
+        return prefix + base64.urlsafe_b64encode(blob).rstrip(b'=').decode('ascii')
+
+    # returns raw text of cipher, raises ValueError if cipher is of an unknown key or was tampered with
+    def decrypt(self, cipher):
+        key_id = self.key_id(cipher)
+        if key_id is None:
+            return self.__legacy.decrypt(cipher)
+
+        aead = self.__ciphers.get(key_id)
+        if aead is None:
+            raise ValueError(f'Unknown key id {key_id!r}.')
+
+        prefix = f'{self.VERSION}{key_id}.'
+        segment = cipher[len(prefix):].encode('ascii')
+        blob = base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+        return aead.decrypt(blob, associated_data=prefix.encode('ascii')).decode('utf-8')
+
+    def encrypt_many(self, raws):
+        prefix = f'{self.VERSION}{self.current_id}.'
+        blobs = self.__ciphers[self.current_id].encrypt_many([raw.encode('utf-8') for raw in raws], associated_data=prefix.encode('ascii'))
+        return [prefix + base64.urlsafe_b64encode(blob).rstrip(b'=').decode('ascii') for blob in blobs]
+
+    # ciphers are decrypted in one AEAD call per key id, legacy ciphers one by one
+    def decrypt_many(self, ciphers):
+        raws = [None] * len(ciphers)
+        indexes_by_key_id = {}
+
+        for index, cipher in enumerate(ciphers):
+            key_id = self.key_id(cipher)
+            if key_id is None:
+                raws[index] = self.__legacy.decrypt(cipher)
+            else:
+                indexes_by_key_id.setdefault(key_id, []).append(index)
+
+        for key_id, indexes in indexes_by_key_id.items():
+            aead = self.__ciphers.get(key_id)
+            if aead is None:
+                raise ValueError(f'Unknown key id {key_id!r}.')
+
+            prefix = f'{self.VERSION}{key_id}.'
+            segments = [ciphers[index][len(prefix):].encode('ascii') for index in indexes]
+            blobs = [base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4)) for segment in segments]
+            for index, raw in zip(indexes, aead.decrypt_many(blobs, associated_data=prefix.encode('ascii'))):
+                raws[index] = raw.decode('utf-8')
+
+        return raws
+
+
+# returns process wide keyring of server encryption keys
+@functools.lru_cache(maxsize=None)
+def server_cipher():
+    return Keyring(settings.SERVER_ENC_KEYS, settings.SERVER_ENC_KEY_ID, legacy_key=settings.SERVER_ENC_KEY)
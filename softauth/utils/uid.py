@@ -0,0 +1,24 @@
+import uuid
+
+# Public uids are uuid4 strings whose four dashes are replaced by one random digit,
+# "xxxxxxxx" d "xxxx" d "4xxx" d "yxxx" d "xxxxxxxxxxxx". Stored as a 128 bit UUID the digit
+# takes the place of the constant version nibble "4" (hex index 12), so no information is lost.
+
+# returns public uid of stored UUID
+def encode(value: uuid.UUID):
+    h = value.hex
+    digit = h[12]
+    if not digit.isdigit():
+        raise ValueError('Not a public uid UUID.')
+    return h[:8] + digit + h[8:12] + digit + '4' + h[13:16] + digit + h[16:20] + digit + h[20:]
+
+# returns stored UUID of public uid, raises ValueError if uid is not in the public format
+def decode(uid: str):
+    if len(uid) != 36:
+        raise ValueError('Invalid uid.')
+
+    digit = uid[8]
+    if not digit.isdigit() or uid[13] != digit or uid[18] != digit or uid[23] != digit or uid[14] != '4':
+        raise ValueError('Invalid uid.')
+
+    return uuid.UUID(hex=uid[:8] + uid[9:13] + digit + uid[15:18] + uid[19:23] + uid[24:])
@@ -0,0 +1,35 @@
+import hashlib
+import user_agents
+from django.conf import settings
+from .lru import LRUCache
+
+_cache = LRUCache(maxsize=settings.USER_AGENT_CACHE_SIZE)
+
+# returns fingerprint hash of the normalized (device, os, browser) family triple
+def hash_families(device, os, browser):
+    normalized = '\x1f'.join(family.strip().lower() for family in (device, os, browser))
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+# returns cached families and fingerprint of the user agent header
+def _resolve(user_agent_header):
+    resolved = _cache.get(user_agent_header)
+
+    if resolved is None:
+        ua = user_agents.parse(user_agent_header)
+        families = (ua.device.family, ua.os.family, ua.browser.family)
+        resolved = (families, hash_families(*families))
+        _cache.set(user_agent_header, resolved)
+
+    return resolved
+
+# returns (device, os, browser) family triple of the user agent header
+def parse(user_agent_header):
+    return _resolve(user_agent_header)[0]
+
+# returns device fingerprint of the user agent header
+def fingerprint(user_agent_header):
+    return _resolve(user_agent_header)[1]
+
+# returns user agent parse cache counters
+def stats():
+    return _cache.stats()
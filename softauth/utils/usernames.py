@@ -0,0 +1,81 @@
+import random
+from collections import Counter
+from .generator import generate_username_base
+
+
+class UsernameAllocator:
+    '''Allocates free usernames base_suffix by checking random suffix candidates of every base in one indexed lookup.
+    Suffixes start at 4 digits and gain a digit whenever a base runs out of free candidates, so the share of taken
+    candidates stays bounded and an allocation needs O(1) lookups however common the base is.'''
+
+    MIN_DIGITS = 4
+    MAX_DIGITS = 12
+    SPARE_CANDIDATES = 8
+    LOOKUP_BATCH_SIZE = 500
+
+    def __init__(self, model, field='username'):
+        self.model = model
+        self.field = field
+
+    # returns free username of names
+    def allocate(self, first_name, last_name):
+        return self.allocate_many([generate_username_base(first_name, last_name)])[0]
+
+    # returns free usernames in order of bases, a base may repeat, no two returned usernames are equal
+    def allocate_many(self, bases):
+        counts = Counter(bases)
+        allocated = {base: [] for base in counts}
+        digits = {base: self.__digits(count) for base, count in counts.items()}
+        used = set()
+
+        while True:
+            pending = {base: count - len(allocated[base]) for base, count in counts.items() if len(allocated[base]) < count}
+            if not pending:
+                break
+
+            candidates = {}
+            for base, needed in pending.items():
+                candidates[base] = self.__candidates(base, digits[base], 2 * needed + self.SPARE_CANDIDATES, used)
+
+            taken = self.__taken([username for usernames in candidates.values() for username in usernames])
+
+            for base, needed in pending.items():
+                free = [username for username in candidates[base] if username not in taken][:needed]
+                allocated[base].extend(free)
+                used.update(free)
+
+                # widening suffixes of a base whose current range is crowded
+                if len(free) < needed:
+                    digits[base] = min(digits[base] + 1, self.MAX_DIGITS)
+
+        positions = Counter()
+        usernames = []
+        for base in bases:
+            usernames.append(allocated[base][positions[base]])
+            positions[base] += 1
+        return usernames
+
+    # returns smallest suffix digits whose range is at least four times the usernames requested
+    def __digits(self, count):
+        digits = self.MIN_DIGITS
+        while digits < self.MAX_DIGITS and 9 * 10 ** (digits - 1) < 4 * count:
+            digits += 1
+        return digits
+
+    @staticmethod
+    def __candidates(base, digits, count, used):
+        low, high = 10 ** (digits - 1), 10 ** digits - 1
+        candidates = set()
+        while len(candidates) < count:
+            username = f'{base}_{random.randint(low, high)}'
+            if username not in used:
+                candidates.add(username)
+        return candidates
+
+    # returns the usernames that are already taken
+    def __taken(self, usernames):
+        taken = set()
+        for start in range(0, len(usernames), self.LOOKUP_BATCH_SIZE):
+            batch = usernames[start:start + self.LOOKUP_BATCH_SIZE]
+            taken.update(self.model.objects.filter(**{f'{self.field}__in': batch}).values_list(self.field, flat=True))
+        return taken